@@ -1,32 +1,45 @@
-from typing import Any, List, Dict, Optional
-import uuid
-import asyncpg
-from llama_index.core.llms import LLM
-from llama_index.core.ingestion import IngestionCache, IngestionPipeline
-from llama_index.core.schema import TransformComponent
+import logging
+from typing import Any, List
+
 from llama_index.core import StorageContext, VectorStoreIndex
 from llama_index.core.chat_engine.types import BaseChatEngine
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.extractors import (
-    KeywordExtractor,
-    SummaryExtractor,
-    TitleExtractor,
-)
-from llama_index.core.chat_engine.types import BaseChatEngine
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import TransformComponent
 from llama_index.storage.docstore.postgres import PostgresDocumentStore
-from llama_index.storage.kvstore.postgres import PostgresKVStore
 from llama_index.storage.index_store.postgres import PostgresIndexStore
-from llama_index.storage.kvstore.postgres.base import params_from_uri
-from llama_index.vector_stores.postgres import PGVectorStore
-from llama_index.core.response_synthesizers import SimpleSummarize
+from llama_index.storage.kvstore.postgres import PostgresKVStore
 
-import env
 import agents.models as models
-from agents.reader import MarkitDownReader
-from agents.prompt import *
-from agents.references import ReferenceStore, FetchError
+import env
+from agents.chat import ChatEngines
+from agents.embedding_cache import CachedEmbedding
+from agents.history import HistoryManager
+from agents.jobs import IndexWorkerPool, JobQueue
 from agents.keywords import KeywordsStore
-import logging
+from agents.maintenance import (
+    CACHE_TABLE,
+    DOCUMENTS_TABLE,
+    STORE_SCHEMA,
+    TEXT_SEARCH_CONFIG,
+    VECTORS_TABLE,
+)
+from agents.metrics import ChatTrace, Gauge, Metrics
+from agents.pipeline import IndexingPipeline
+from agents.prompt import *
+from agents.reader import ConversionPool, MarkitDownReader
+from agents.references import ReferenceStore
+from agents.response_cache import ResponseCache
+from agents.retrieval import (
+    EmptyRetriever,
+    HybridRetriever,
+    RetrievalOptions,
+    ScopedDenseRetriever,
+)
+from agents.store_engines import SharedPostgresKVStore, StoreEngines
+from agents.summaries import ReferenceSummarizer
+from agents.vector_store import TunedPGVectorStore, VectorIndexConfig
+
 logger = logging.getLogger(__name__)
 
 class Models:
@@ -38,6 +51,8 @@ class Models:
     def get_llm(self, model_name: str | None = None) -> LLM:
         if model_name is None:
             return self.simple
+        if model_name in models.llms:
+            return models.llms[model_name]
         raise ValueError(f"Invalid model name: {model_name}")
 
 class AI:
@@ -45,53 +60,97 @@ class AI:
     transformations: list[TransformComponent]
     models: Models
     cache_store: PostgresKVStore
-    ingest_pipeline: IngestionPipeline
+    indexing: IndexingPipeline
     index: VectorStoreIndex
     references: ReferenceStore
     keywords: KeywordsStore
+    jobs: JobQueue
+    converter: ConversionPool
+    response_cache: ResponseCache
+    chat_engines: ChatEngines
+    history: HistoryManager
+    metrics: Metrics | None
+    store_engines: StoreEngines
 
     def __init__(self, pg: Any, logger: logging.Logger):
-        url = pg.database_url
-        pg_params: dict[str, Any] = params_from_uri(url)
-        pg_params["schema_name"] = "agentstore"
-        
         self.pg = pg
+        index_config = VectorIndexConfig.from_env()
+        # All llama_index stores share one pair of bounded pools, sized to what the
+        # asyncpg pool and the keyword index listener leave of the connection budget
+        self.store_engines = StoreEngines.from_budget(
+            pg.database_url,
+            budget=env.POSTGRES_CONNECTION_BUDGET,
+            # The pool may not be connected yet, e.g. in benchmarks, so its size
+            # comes from env
+            reserved=env.POSTGRES_POOL_MAX_SIZE + 1,
+            logger=logger,
+            connect_settings=index_config.query_settings(),
+        )
         self.models = Models(
-            embeddings=models.openai_embeddings,
+            # Shared by the index, the indexing pipeline and chat retrieval
+            embeddings=CachedEmbedding(
+                models.openai_embeddings,
+                self.pg,
+                lru_size=env.EMBEDDING_CACHE_SIZE,
+            ),
             simple=models.openai_gpt4o_mini,
             agent=models.openai_gpt4o_mini,
         )
 
         self.storage = StorageContext.from_defaults(
-            docstore=PostgresDocumentStore.from_params(
-                table_name="documents",
-                **pg_params,
+            docstore=PostgresDocumentStore(
+                SharedPostgresKVStore(
+                    self.store_engines,
+                    table_name=DOCUMENTS_TABLE,
+                    schema_name=STORE_SCHEMA,
+                ),
+            ),
+            index_store=PostgresIndexStore(
+                SharedPostgresKVStore(
+                    self.store_engines,
+                    table_name="index",
+                    schema_name=STORE_SCHEMA,
+                ),
             ),
-            index_store=PostgresIndexStore.from_params(**pg_params, table_name="index"),
             graph_store=None,
-            vector_store=PGVectorStore.from_params(**pg_params, table_name="vectors"),
-            image_store=PGVectorStore.from_params(**pg_params, table_name="images"),
+            vector_store=TunedPGVectorStore.from_params(
+                connection_string=self.store_engines.url,
+                async_connection_string=self.store_engines.async_url,
+                schema_name=STORE_SCHEMA,
+                table_name=VECTORS_TABLE,
+                # New tables get the full-text column used by the hybrid retriever
+                hybrid_search=True,
+                text_search_config=TEXT_SEARCH_CONFIG,
+                index_config=index_config,
+                engines=self.store_engines,
+            ),
+            image_store=TunedPGVectorStore.from_params(
+                connection_string=self.store_engines.url,
+                async_connection_string=self.store_engines.async_url,
+                schema_name=STORE_SCHEMA,
+                table_name="images",
+                engines=self.store_engines,
+            ),
         )
 
-        self.doc_transformations = [
-            TitleExtractor(llm=self.models.simple),
-            SummaryExtractor(llm=self.models.simple),
-            KeywordExtractor(llm=self.models.simple),
-        ]
-
-        self.transformations = [
-            SentenceSplitter(),
-            SummaryExtractor(llm=models.openai_gpt4o_mini, summaries=["self"]),
-            models.openai_embeddings,
-        ]
+        self.cache_store = SharedPostgresKVStore(
+            self.store_engines, table_name=CACHE_TABLE, schema_name=STORE_SCHEMA
+        )
 
-        self.cache_store = PostgresKVStore.from_params(**pg_params, table_name="cache")
-        self.ingest_pipeline = IngestionPipeline(
-            transformations=self.transformations,
-            vector_store=self.storage.vector_store,
-            cache=IngestionCache(cache=self.cache_store),
-            docstore=self.storage.docstore,
+        # Built once and shared by every indexing task
+        self.indexing = IndexingPipeline(
+            self.pg,
+            self.models,
+            self.cache_store,
+            self.storage,
+            default_profile=env.INDEX_PROFILE,
+            summarizer=ReferenceSummarizer(
+                self.models.simple,
+                fan_out=env.SUMMARY_FAN_OUT,
+                default_strategy=env.SUMMARY_STRATEGY,
+            ),
         )
+        self.transformations = self.indexing.transformations()
         
         self.index = VectorStoreIndex(
             nodes=[],
@@ -102,17 +161,170 @@ class AI:
             show_progress=True,
         )
         
+        self.jobs = JobQueue(
+            self.pg,
+            logger,
+            max_attempts=env.INDEX_MAX_ATTEMPTS,
+            retry_backoff=env.INDEX_RETRY_BACKOFF,
+            job_timeout=env.INDEX_JOB_TIMEOUT,
+        )
+        self.converter = ConversionPool(
+            max_workers=env.CONVERT_WORKERS,
+            timeout=env.CONVERT_TIMEOUT,
+            max_bytes=env.CONVERT_MAX_BYTES,
+        )
+        self.keywords = KeywordsStore(
+            self.pg, logger, max_per_reference=env.KEYWORDS_PER_REFERENCE
+        )
         self.references = ReferenceStore(
             self.pg,
             self.models,
             self.cache_store,
             self.storage,
-            self.ingest_pipeline,
-            logger
+            self.indexing,
+            self.jobs,
+            logger,
+            reader=MarkitDownReader(self.converter),
+            keyword_index=self.keywords.index,
+            keyword_normalizer=self.keywords.normalizer,
         )
-        self.keywords = KeywordsStore(self.pg)
+        self.response_cache = ResponseCache(
+            self.pg,
+            self.models.embeddings,
+            logger,
+            threshold=env.CHAT_CACHE_THRESHOLD,
+            ttl=env.CHAT_CACHE_TTL,
+        )
+        # Disabled metrics are None, so the chat path skips instrumentation entirely
+        self.metrics = None
+        if env.METRICS_ENABLED:
+            self.metrics = Metrics(logging.getLogger("metrics"))
+            self.metrics.register(Gauge(
+                "db_connections",
+                "Open Postgres connections of the process",
+                self.connection_count,
+            ))
+            self.metrics.register(Gauge(
+                "db_store_connections",
+                "Open connections of the llama_index stores",
+                self.store_engines.size,
+            ))
+            self.metrics.register(Gauge(
+                "db_connection_budget",
+                "Maximum Postgres connections of the process",
+                lambda: env.POSTGRES_CONNECTION_BUDGET,
+            ))
+        self.history = HistoryManager(
+            self.pg,
+            self.models.simple,
+            logger,
+            recent_turns=env.CHAT_HISTORY_TURNS,
+            token_budget=env.CHAT_HISTORY_TOKEN_BUDGET,
+            max_part_chars=env.CHAT_HISTORY_MAX_PART_CHARS,
+        )
+        self.chat_engines = ChatEngines(self.models, self.get_retriever)
+        self.chat_engines.warm([None])
         
-    def get_llm(self, model_name: str | None = None) -> BaseChatEngine:
-        llm = self.models.get_llm(model_name)
-        return self.index.as_chat_engine(llm=llm)
-    
\ No newline at end of file
+    def shutdown(self) -> None:
+        self.converter.shutdown()
+
+    def connection_count(self) -> int:
+        """
+        Open Postgres connections: asyncpg pool, store pools and the keyword index
+        listener
+        """
+        listener = 1 if self.keywords.index.listening else 0
+        return self.pg.pool.get_size() + self.store_engines.size() + listener
+
+    def index_workers(self, concurrency: int | None = None) -> IndexWorkerPool:
+        """Create a worker pool that drains the indexing job queue"""
+        return IndexWorkerPool(
+            self.jobs,
+            self.references.async_index_reference,
+            self.jobs.logger,
+            concurrency=concurrency or env.INDEX_WORKERS,
+            poll_interval=env.INDEX_POLL_INTERVAL,
+            recover_interval=env.INDEX_RECOVER_INTERVAL,
+        )
+        
+    async def async_retrieval_scope(
+        self,
+        keywords: List[str] | None = None,
+        reference_ids: List[str] | None = None,
+    ) -> List[str] | None:
+        """
+        Reference IDs chat retrieval is restricted to, None for no restriction.
+        References matching any of the keywords are combined with the given IDs
+        by intersection.
+        """
+        if not keywords and reference_ids is None:
+            return None
+        scope = None
+        if reference_ids is not None:
+            scope = list(dict.fromkeys(reference_ids))
+        if keywords:
+            matching = await self.keywords.async_get_reference_ids_for_keywords(
+                keywords
+            )
+            if scope is None:
+                scope = matching
+            else:
+                matching = set(matching)
+                scope = [id for id in scope if id in matching]
+        return scope
+
+    def get_retriever(
+        self,
+        options: RetrievalOptions | None = None,
+        reference_ids: List[str] | None = None,
+    ) -> BaseRetriever:
+        options = options or RetrievalOptions()
+        if reference_ids is not None and len(reference_ids) == 0:
+            return EmptyRetriever()
+        if options.mode == "hybrid":
+            return HybridRetriever(
+                self.pg,
+                self.models.embeddings,
+                top_k=options.top_k,
+                dense_weight=options.dense_weight,
+                sparse_weight=options.sparse_weight,
+                rrf_k=env.CHAT_RRF_K,
+                reference_ids=reference_ids,
+                query_settings=VectorIndexConfig.from_env().query_settings(),
+                engine=self.store_engines.engine,
+            )
+        if reference_ids is not None:
+            return ScopedDenseRetriever(
+                self.pg,
+                self.models.embeddings,
+                reference_ids,
+                top_k=options.top_k,
+                query_settings=VectorIndexConfig.from_env().query_settings(),
+                engine=self.store_engines.engine,
+            )
+        return self.index.as_retriever(similarity_top_k=options.top_k)
+
+    def get_llm(
+        self,
+        model_name: str | None = None,
+        retrieval: RetrievalOptions | None = None,
+        reference_ids: List[str] | None = None,
+        chat_history: List[ChatMessage] | None = None,
+        trace: ChatTrace | None = None,
+        query: str | None = None,
+        query_embedding: List[float] | None = None,
+    ) -> BaseChatEngine:
+        """
+        Chat engine for one request, holding `chat_history` as its conversation
+        state. `query_embedding` of `query` is reused by retrieval instead of
+        embedding it again.
+        """
+        return self.chat_engines.get(
+            model_name,
+            retrieval,
+            reference_ids,
+            chat_history,
+            trace,
+            query,
+            query_embedding,
+        )
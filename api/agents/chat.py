@@ -0,0 +1,158 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.chat_engine import CondensePlusContextChatEngine
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from pydantic import Field
+
+from agents.metrics import ChatTrace
+from agents.retrieval import RetrievalOptions
+
+
+class RequestMemory(BaseMemory):
+    """
+    Conversation state of a single chat request, built from the messages sent by
+    the client. Holds the messages as they are, without a token counting buffer.
+    """
+    messages: List[ChatMessage] = Field(default_factory=list)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RequestMemory"
+
+    @classmethod
+    def from_defaults(
+        cls, chat_history: Optional[List[ChatMessage]] = None, **kwargs: Any
+    ) -> "RequestMemory":
+        return cls(messages=list(chat_history or []))
+
+    def get(self, input: Optional[str] = None, **kwargs: Any) -> List[ChatMessage]:
+        return self.messages
+
+    def get_all(self) -> List[ChatMessage]:
+        return self.messages
+
+    def put(self, message: ChatMessage) -> None:
+        self.messages.append(message)
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        self.messages = list(messages)
+
+    def reset(self) -> None:
+        self.messages = []
+
+class TimedRetriever(BaseRetriever):
+    """Records the latency of a shared retriever on the trace of one request"""
+
+    def __init__(self, retriever: BaseRetriever, trace: ChatTrace):
+        self.retriever = retriever
+        self.trace = trace
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        start = time.perf_counter()
+        try:
+            return self.retriever.retrieve(query_bundle)
+        finally:
+            self.trace.retrieved(time.perf_counter() - start)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        start = time.perf_counter()
+        try:
+            return await self.retriever.aretrieve(query_bundle)
+        finally:
+            self.trace.retrieved(time.perf_counter() - start)
+
+class EmbeddedQueryRetriever(BaseRetriever):
+    """
+    Hands an embedding of the query computed earlier in the request to a shared
+    retriever
+    """
+
+    def __init__(self, retriever: BaseRetriever, query: str, embedding: List[float]):
+        self.retriever = retriever
+        self.query = query
+        self.embedding = embedding
+        super().__init__()
+
+    def _with_embedding(self, query_bundle: QueryBundle) -> QueryBundle:
+        # A condensed question differs from the query and is embedded by the retriever
+        if query_bundle.embedding is None and query_bundle.query_str == self.query:
+            query_bundle.embedding = self.embedding
+        return query_bundle
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.retriever.retrieve(self._with_embedding(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return await self.retriever.aretrieve(self._with_embedding(query_bundle))
+
+class ChatEngines:
+    """
+    Registry of the chat engine components shared by all requests of a process.
+
+    Retrievers are built once per retrieval config and LLMs are looked up once per
+    model. A request only creates its memory and a thin engine around the shared
+    components, so concurrent chats never share conversation state. Scoped
+    retrievers depend on the request and are built per request.
+    """
+
+    def __init__(
+        self,
+        models: Any,
+        retriever_factory: Callable[
+            [RetrievalOptions, Optional[List[str]]], BaseRetriever
+        ],
+    ):
+        self.models = models
+        self.retriever_factory = retriever_factory
+        self._retrievers: Dict[str, BaseRetriever] = {}
+
+    def warm(
+        self,
+        model_names: List[Optional[str]],
+        options: Optional[List[RetrievalOptions]] = None,
+    ) -> None:
+        """
+        Build the components of the given models and retrieval configs ahead of
+        the first request
+        """
+        for model_name in model_names:
+            self.models.get_llm(model_name)
+        for option in options or [RetrievalOptions()]:
+            self.retriever(option)
+
+    def retriever(
+        self, options: RetrievalOptions, reference_ids: Optional[List[str]] = None
+    ) -> BaseRetriever:
+        if reference_ids is not None:
+            return self.retriever_factory(options, reference_ids)
+        key = options.model_dump_json()
+        retriever = self._retrievers.get(key)
+        if retriever is None:
+            retriever = self._retrievers[key] = self.retriever_factory(options, None)
+        return retriever
+
+    def get(
+        self,
+        model_name: Optional[str] = None,
+        retrieval: Optional[RetrievalOptions] = None,
+        reference_ids: Optional[List[str]] = None,
+        chat_history: Optional[List[ChatMessage]] = None,
+        trace: Optional[ChatTrace] = None,
+        query: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> CondensePlusContextChatEngine:
+        retriever = self.retriever(retrieval or RetrievalOptions(), reference_ids)
+        if query is not None and query_embedding is not None:
+            retriever = EmbeddedQueryRetriever(retriever, query, query_embedding)
+        if trace is not None:
+            retriever = TimedRetriever(retriever, trace)
+        return CondensePlusContextChatEngine(
+            retriever=retriever,
+            llm=self.models.get_llm(model_name),
+            memory=RequestMemory.from_defaults(chat_history),
+        )
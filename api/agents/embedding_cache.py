@@ -0,0 +1,153 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that caches embeddings in Postgres, keyed by model
+    name, dimension and the sha256 of the text, with an in-process LRU in front.
+
+    Queries and chunks share the cache, which assumes the wrapped model embeds
+    queries and texts the same way (true for OpenAI). The synchronous methods
+    only use the LRU, since the database is accessed through the asyncpg pool.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _pg: Any = PrivateAttr()
+    _lru: "OrderedDict[str, Embedding]" = PrivateAttr(default_factory=OrderedDict)
+    _lru_size: int = PrivateAttr()
+    _dim: int = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        pg: Any,
+        lru_size: int = 10000,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._pg = pg
+        self._lru_size = lru_size
+        # 0 stands for the default dimension of the model
+        self._dim = getattr(embed_model, "dimensions", None) or 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _lru_get(self, key: str) -> Optional[Embedding]:
+        embedding = self._lru.get(key)
+        if embedding is not None:
+            self._lru.move_to_end(key)
+        return embedding
+
+    def _lru_put(self, key: str, embedding: Embedding) -> None:
+        self._lru[key] = embedding
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    async def _async_load(self, keys: List[str]) -> Dict[str, Embedding]:
+        async with self._pg.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT text_hash, embedding FROM embedding_cache
+                WHERE model = $1 AND dim = $2 AND text_hash = ANY($3::text[])
+            ''', self.model_name, self._dim, keys)
+        return {row["text_hash"]: list(row["embedding"]) for row in rows}
+
+    async def _async_save(self, embeddings: Dict[str, Embedding]) -> None:
+        rows = [
+            (self.model_name, self._dim, key, embedding)
+            for key, embedding in embeddings.items()
+        ]
+        async with self._pg.pool.acquire() as conn:
+            await conn.executemany('''
+                INSERT INTO embedding_cache (model, dim, text_hash, embedding)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT DO NOTHING
+            ''', rows)
+
+    async def _async_embed(
+        self, texts: List[str], query: bool = False
+    ) -> List[Embedding]:
+        keys = [_text_hash(text) for text in texts]
+        found = {}
+        for key in keys:
+            embedding = self._lru_get(key)
+            if embedding is not None:
+                found[key] = embedding
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            found.update(await self._async_load(missing))
+
+        # Duplicate texts within a batch are embedded once
+        pending = {}
+        for key, text in zip(keys, texts, strict=True):
+            if key not in found:
+                pending.setdefault(key, text)
+        if pending:
+            if query:
+                computed = [
+                    await self._embed_model.aget_query_embedding(text)
+                    for text in pending.values()
+                ]
+            else:
+                computed = await self._embed_model.aget_text_embedding_batch(
+                    list(pending.values())
+                )
+            new = dict(zip(pending.keys(), computed, strict=True))
+            await self._async_save(new)
+            found.update(new)
+
+        for key, embedding in found.items():
+            self._lru_put(key, embedding)
+        return [found[key] for key in keys]
+
+    def _embed(self, texts: List[str], query: bool = False) -> List[Embedding]:
+        keys = [_text_hash(text) for text in texts]
+        results = [self._lru_get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if missing:
+            if query:
+                computed = [
+                    self._embed_model.get_query_embedding(texts[i]) for i in missing
+                ]
+            else:
+                computed = self._embed_model.get_text_embedding_batch(
+                    [texts[i] for i in missing]
+                )
+            for i, embedding in zip(missing, computed, strict=True):
+                results[i] = embedding
+                self._lru_put(keys[i], embedding)
+        return results
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([query], query=True)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return (await self._async_embed([query], query=True))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._async_embed([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._async_embed(texts)
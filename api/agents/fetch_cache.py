@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, Optional
+
+from agents.reader import FetchResult
+
+
+class FetchCache:
+    """
+    Per-URL record of the last fetch: HTTP validators (ETag, Last-Modified) and
+    content hashes of the raw document and of the converted markdown. Used to
+    send conditional requests and to skip conversion and indexing of documents
+    that did not change.
+    """
+
+    def __init__(self, pg: Any):
+        self.pg = pg
+
+    async def async_get(self, url: str) -> Optional[Dict[str, Any]]:
+        async with self.pg.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT etag, last_modified, content_hash, markdown_hash
+                FROM fetch_cache WHERE url = $1
+            ''', url)
+            return dict(row) if row else None
+
+    async def async_put(self, url: str, result: FetchResult) -> None:
+        await self.async_put_many([(url, result)])
+
+    async def async_put_many(self, results: List[tuple[str, FetchResult]]) -> None:
+        if not results:
+            return
+        async with self.pg.pool.acquire() as conn:
+            # The markdown hash is only known when the document was converted
+            await conn.executemany('''
+                INSERT INTO fetch_cache (
+                    url, etag, last_modified, content_hash, markdown_hash, fetched_at
+                )
+                VALUES ($1, $2, $3, $4, $5, now())
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = EXCLUDED.etag,
+                    last_modified = EXCLUDED.last_modified,
+                    content_hash = EXCLUDED.content_hash,
+                    markdown_hash = COALESCE(
+                        EXCLUDED.markdown_hash, fetch_cache.markdown_hash
+                    ),
+                    fetched_at = EXCLUDED.fetched_at
+            ''', [
+                (url, r.etag, r.last_modified, r.content_hash, r.markdown_hash)
+                for url, r in results
+            ])
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+from typing import Any, Callable, List, Optional, Sequence
+
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.utils import get_tokenizer
+
+from agents.prompt import CoreMessage, CoreSystemMessage, CoreUserMessage, Message
+
+SUMMARIZE_HISTORY_PROMPT = PromptTemplate(
+    "Summary of the conversation so far:\n"
+    "---------------------\n"
+    "{summary}\n"
+    "---------------------\n"
+    "New messages:\n"
+    "---------------------\n"
+    "{messages}\n"
+    "---------------------\n"
+    "Update the summary with the new messages. Keep facts, decisions, names and open "
+    "questions the user may refer back to, and leave out small talk.\n"
+    "Summary: "
+)
+
+Turn = List[CoreMessage]
+
+def _split_turns(messages: Sequence[CoreMessage]) -> List[Turn]:
+    """Group messages into turns, each starting with a user message"""
+    turns: List[Turn] = []
+    for message in messages:
+        if isinstance(message, CoreUserMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def _format_turn(turn: Turn) -> str:
+    return "\n".join(f"{message.role}: {message.content_str()}" for message in turn)
+
+def _chain_hash(previous: str, turn: Turn) -> str:
+    return hashlib.sha256(f"{previous}\0{_format_turn(turn)}".encode()).hexdigest()
+
+class HistoryManager:
+    """
+    Keeps the chat history sent to the LLM within a token budget.
+
+    The last `recent_turns` turns are kept verbatim, fewer if they do not fit in
+    `token_budget`. Older turns are folded into a rolling summary. Summaries are
+    stored in `chat_summaries`, keyed by a hash chained over the summarized turns,
+    so the next request of the same conversation only summarizes the turns that
+    dropped out of the window since. Turns are summarized in chunks of at most
+    `token_budget` tokens (at least one turn), storing the summary after each
+    chunk. Oversized tool and file parts are truncated to `max_part_chars`.
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        llm: LLM,
+        logger: logging.Logger,
+        recent_turns: int = 6,
+        token_budget: int = 3000,
+        max_part_chars: int = 4000,
+        tokenizer: Optional[Callable[[str], List]] = None,
+    ):
+        self.pg = pg
+        self.llm = llm
+        self.logger = logger
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.max_part_chars = max_part_chars
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    def _count_tokens(self, turn: Turn) -> int:
+        return len(self.tokenizer(_format_turn(turn)))
+
+    async def async_history(self, messages: Sequence[Message]) -> List[ChatMessage]:
+        """Chat history for the LLM from the messages preceding the current query"""
+        messages = [message.truncate(self.max_part_chars) for message in messages]
+        system = [m for m in messages if isinstance(m, CoreSystemMessage)]
+        turns = _split_turns([
+            m for m in messages if not isinstance(m, CoreSystemMessage)
+        ])
+
+        # Keep as many recent turns verbatim as fit in the budget, at least one
+        keep = 0
+        used = 0
+        candidates = turns[-self.recent_turns:] if self.recent_turns > 0 else []
+        for turn in reversed(candidates):
+            tokens = self._count_tokens(turn)
+            if keep > 0 and used + tokens > self.token_budget:
+                break
+            keep += 1
+            used += tokens
+        older, recent = turns[:len(turns) - keep], turns[len(turns) - keep:]
+
+        history = [m.to_chatmessage() for m in system]
+        if older:
+            summary = await self.async_summary(older)
+            history.append(ChatMessage(
+                role="system",
+                content=f"Summary of the earlier conversation:\n{summary}",
+            ))
+        history.extend(m.to_chatmessage() for turn in recent for m in turn)
+        return history
+
+    async def async_summary(self, turns: List[Turn]) -> str:
+        """
+        Summary of the given turns, extending the longest stored summary of a
+        prefix of them
+        """
+        hashes = []
+        previous = ""
+        for turn in turns:
+            previous = _chain_hash(previous, turn)
+            hashes.append(previous)
+
+        async with self.pg.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                UPDATE chat_summaries SET used_at = now()
+                WHERE hash = (
+                    SELECT hash FROM chat_summaries
+                    WHERE hash = ANY($1::text[])
+                    ORDER BY turns DESC
+                    LIMIT 1
+                )
+                RETURNING turns, summary
+            ''', hashes)
+
+        summarized, summary = (row["turns"], row["summary"]) if row else (0, "")
+        if summarized == len(turns):
+            return summary
+
+        self.logger.info(
+            f"Summarizing {len(turns) - summarized} turns on top of "
+            f"{summarized} summarized turns"
+        )
+        while summarized < len(turns):
+            end = summarized + 1
+            used = self._count_tokens(turns[summarized])
+            while end < len(turns):
+                tokens = self._count_tokens(turns[end])
+                if used + tokens > self.token_budget:
+                    break
+                end += 1
+                used += tokens
+
+            messages = "\n\n".join(_format_turn(turn) for turn in turns[summarized:end])
+            summary = (await self.llm.apredict(
+                SUMMARIZE_HISTORY_PROMPT,
+                summary=summary or "(empty)",
+                messages=messages,
+            )).strip()
+            summarized = end
+
+            async with self.pg.pool.acquire() as conn:
+                await conn.execute('''
+                    INSERT INTO chat_summaries (hash, turns, summary)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (hash) DO UPDATE
+                    SET summary = EXCLUDED.summary, used_at = now()
+                ''', hashes[summarized - 1], summarized, summary)
+        return summary
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+
+class JobQueue:
+    """
+    Durable queue of indexing jobs stored in the `index_jobs` table.
+
+    Jobs are claimed with `FOR UPDATE SKIP LOCKED`, so any number of workers
+    (in the API process or in separate `worker.py` processes) can share the
+    same queue without handing out a job twice.
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        logger: logging.Logger,
+        max_attempts: int = 5,
+        retry_backoff: float = 30,
+        job_timeout: float = 900,
+    ):
+        self.pg = pg
+        self.logger = logger
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.job_timeout = job_timeout
+        self.wakeup = asyncio.Event()
+
+    async def async_enqueue(
+        self, reference_id: str, profile: str | None = None
+    ) -> None:
+        """
+        Schedule a reference for indexing with the given indexing profile.
+        No-op if a job is already pending.
+        """
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO index_jobs (reference_id, profile)
+                VALUES ($1, $2)
+                ON CONFLICT (reference_id) WHERE status = 'pending' DO NOTHING
+            ''', reference_id, profile)
+        self.wakeup.set()
+
+    async def async_enqueue_many(
+        self, reference_ids: list[str], profile: str | None = None
+    ) -> None:
+        """Schedule many references for indexing with a single statement"""
+        if not reference_ids:
+            return
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO index_jobs (reference_id, profile)
+                SELECT DISTINCT unnest($1::uuid[]), $2::text
+                ON CONFLICT (reference_id) WHERE status = 'pending' DO NOTHING
+            ''', reference_ids, profile)
+        self.wakeup.set()
+
+    async def async_claim(self) -> Optional[dict[str, Any]]:
+        """Claim the next runnable job, or return None if the queue is empty"""
+        async with self.pg.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                UPDATE index_jobs
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    locked_at = now(),
+                    updated_at = now()
+                WHERE id = (
+                    SELECT id FROM index_jobs
+                    WHERE status = 'pending' AND run_at <= now()
+                    ORDER BY run_at, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, reference_id, profile, attempts
+            ''')
+            return dict(row) if row else None
+
+    async def async_complete(self, job_id: int) -> None:
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE index_jobs
+                SET status = 'done',
+                    locked_at = NULL,
+                    last_error = NULL,
+                    updated_at = now()
+                WHERE id = $1
+            ''', job_id)
+
+    async def async_fail(self, job_id: int, error: str) -> None:
+        """
+        Record a failed attempt. The job is rescheduled with exponential backoff
+        until `max_attempts` is reached. If a newer job for the same reference is
+        already pending, the failed one is not retried.
+        """
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE index_jobs j
+                SET status = CASE
+                        WHEN j.attempts < $3 AND NOT EXISTS (
+                            SELECT 1 FROM index_jobs p
+                            WHERE p.reference_id = j.reference_id
+                              AND p.status = 'pending'
+                        ) THEN 'pending'
+                        ELSE 'failed'
+                    END,
+                    run_at = now()
+                        + make_interval(secs => $4 * power(2, j.attempts - 1)),
+                    locked_at = NULL,
+                    last_error = $2,
+                    updated_at = now()
+                WHERE j.id = $1
+            ''', job_id, error, self.max_attempts, self.retry_backoff)
+
+    async def async_release(self, job_id: int) -> None:
+        """
+        Hand a job back to the queue without counting the attempt, e.g. on
+        shutdown
+        """
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE index_jobs j
+                SET status = CASE
+                        WHEN NOT EXISTS (
+                            SELECT 1 FROM index_jobs p
+                            WHERE p.reference_id = j.reference_id
+                              AND p.status = 'pending'
+                        ) THEN 'pending'
+                        ELSE 'cancelled'
+                    END,
+                    attempts = greatest(j.attempts - 1, 0),
+                    locked_at = NULL,
+                    updated_at = now()
+                WHERE j.id = $1
+            ''', job_id)
+
+    async def async_recover(self) -> int:
+        """
+        Requeue unfinished work: jobs whose lease expired because their worker
+        died while running them, and unindexed references that never got a job.
+        Runs at startup and periodically from the worker pool. Jobs that already
+        used up their attempts are marked failed instead, so a job that crashes
+        its worker is not retried forever.
+        """
+        async with self.pg.pool.acquire() as conn:
+            async with conn.transaction():
+                stale = await conn.fetch('''
+                    UPDATE index_jobs j
+                    SET status = CASE
+                            WHEN j.attempts < $2 THEN 'pending' ELSE 'failed'
+                        END,
+                        locked_at = NULL,
+                        run_at = now(),
+                        last_error = CASE
+                            WHEN j.attempts < $2 THEN j.last_error ELSE 'Lease expired'
+                        END,
+                        updated_at = now()
+                    WHERE j.status = 'running'
+                      AND j.locked_at < now() - make_interval(secs => $1)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM index_jobs p
+                          WHERE p.reference_id = j.reference_id
+                            AND p.status = 'pending'
+                      )
+                    RETURNING j.id
+                ''', self.job_timeout, self.max_attempts)
+                orphaned = await conn.fetch('''
+                    INSERT INTO index_jobs (reference_id)
+                    SELECT r.id FROM "references" r
+                    WHERE NOT r.indexed
+                      AND NOT EXISTS (
+                          SELECT 1 FROM index_jobs j WHERE j.reference_id = r.id
+                      )
+                    ON CONFLICT (reference_id) WHERE status = 'pending' DO NOTHING
+                    RETURNING id
+                ''')
+        count = len(stale) + len(orphaned)
+        if count:
+            self.logger.info(f"Requeued {count} unfinished indexing jobs")
+            self.wakeup.set()
+        return count
+
+class IndexWorkerPool:
+    """
+    Runs a fixed number of asyncio workers that drain the JobQueue.
+
+    The pool bounds how many indexing pipelines run concurrently in this
+    process. It can be started from the FastAPI lifespan or from `worker.py`.
+    Every `recover_interval` seconds it requeues jobs whose lease expired, e.g.
+    jobs of a process that crashed and restarted before the lease ran out. A
+    job is abandoned after the queue's `job_timeout`, so a lease only expires
+    if its worker is gone.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[str, str | None], Awaitable[Any]],
+        logger: logging.Logger,
+        concurrency: int = 4,
+        poll_interval: float = 2,
+        recover_interval: float = 60,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.logger = logger
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.recover_interval = recover_interval
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def start(self) -> None:
+        await self.queue.async_recover()
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._run(i), name=f"index-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._recover(), name="index-recover"))
+        self.logger.info(f"Started {self.concurrency} indexing workers")
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        self.queue.wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.logger.info("Indexing workers stopped")
+
+    async def wait(self) -> None:
+        """Block until the pool is stopped"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, worker_id: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.async_claim()
+            except Exception as e:
+                self.logger.error(
+                    f"Indexing worker {worker_id} failed to claim job: {str(e)}"
+                )
+                job = None
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+
+            reference_id = str(job["reference_id"])
+            self.logger.info(
+                f"Worker {worker_id} indexing reference {reference_id} "
+                f"(attempt {job['attempts']})"
+            )
+            timeout = self.queue.job_timeout
+            try:
+                await asyncio.wait_for(
+                    self.handler(reference_id, job["profile"]), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                self.logger.error(
+                    f"Indexing job {job['id']} for reference {reference_id} timed out"
+                )
+                await self.queue.async_fail(job["id"], f"Timed out after {timeout}s")
+            except asyncio.CancelledError:
+                # If the release fails the job stays 'running' and async_recover
+                # picks it up once its lease expires.
+                try:
+                    await self.queue.async_release(job["id"])
+                finally:
+                    raise
+            except Exception as e:
+                self.logger.error(
+                    f"Indexing job {job['id']} for reference {reference_id} "
+                    f"failed: {str(e)}"
+                )
+                self.logger.exception(e)
+                await self.queue.async_fail(job["id"], str(e))
+            else:
+                await self.queue.async_complete(job["id"])
+
+    async def _recover(self) -> None:
+        while not self._stopping.is_set():
+            await asyncio.sleep(self.recover_interval)
+            try:
+                await self.queue.async_recover()
+            except Exception as e:
+                self.logger.error(f"Failed to recover indexing jobs: {str(e)}")
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self.queue.wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self.queue.wakeup.clear()
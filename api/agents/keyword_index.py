@@ -0,0 +1,373 @@
+import asyncio
+import bisect
+import heapq
+import logging
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+import asyncpg
+
+# Channel of the notifications sent by the triggers on references and
+# references_keywords. The payload is a comma separated list of changed
+# reference IDs, or "*" if too many changed at once.
+NOTIFY_CHANNEL = "references_keywords_changed"
+
+# Postings of a keyword: sorted ordinals, or a bitmap for keywords of many references
+Postings = Union[array, bytearray]
+
+class KeywordIndex:
+    """
+    In-memory inverted index of reference keywords.
+
+    Every reference gets a dense ordinal. Each keyword maps to the postings of
+    its references: a sorted array of ordinals for keywords of few references,
+    or a bitmap (bytearray) once the array would be larger than the bitmap, so
+    the long tail of rare keywords costs 4 bytes per link. Tag queries turn the
+    postings into int bitmaps and combine them bitwise: AND for all-of, OR for
+    any-of and AND NOT for none-of. A forward index (ordinal -> keyword ids)
+    counts facets of small result sets without touching every keyword.
+
+    The index is loaded once and kept current by LISTEN/NOTIFY: changed
+    references are updated in place. Ordinals of deleted references are only
+    reused by a reload, which happens once they make up `COMPACT_RATIO` of all
+    ordinals. If the listening connection is lost, the index is reloaded in full
+    before the next query.
+    """
+
+    # Up to this many matching references, facets are counted via the forward index
+    FORWARD_COUNT_LIMIT = 5000
+    # Reload (renumbering the ordinals) once this share of ordinals is deleted
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, pg: Any, logger: logging.Logger):
+        self.pg = pg
+        self.logger = logger
+        self.loaded = False
+        self._listener: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+        self._updates: Set[asyncio.Task] = set()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.reference_ids: List[Optional[str]] = []
+        self.ordinals: Dict[str, int] = {}
+        # (created_at, id) of each ordinal, the sort key of reference listings
+        self.sort_keys: List[Optional[tuple[str, str]]] = []
+        self.universe = bytearray()
+        self.deleted = 0
+        self.keyword_ids: Dict[str, int] = {}
+        self.keywords: Dict[int, str] = {}
+        self.postings: Dict[int, Postings] = {}
+        self.forward: Dict[int, tuple[int, ...]] = {}
+
+    @property
+    def listening(self) -> bool:
+        return self._listener is not None and not self._listener.is_closed()
+
+    async def async_start(self) -> None:
+        """Listen for changes and load the index"""
+        await self._async_listen()
+        await self.async_refresh()
+
+    async def async_stop(self) -> None:
+        for task in list(self._updates):
+            task.cancel()
+        listener, self._listener = self._listener, None
+        if listener is not None and not listener.is_closed():
+            # A deliberate close is not a lost connection
+            listener.remove_termination_listener(self._on_listener_closed)
+            await listener.close()
+
+    async def _async_listen(self) -> None:
+        # A dedicated connection, so listening does not hold a pool connection
+        self._listener = await asyncpg.connect(self.pg.database_url)
+        await self._listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        self._listener.add_termination_listener(self._on_listener_closed)
+
+    def _on_listener_closed(self, conn: Any) -> None:
+        self.logger.warning(
+            "Keyword index lost its listening connection, reloading on next query"
+        )
+        self._listener = None
+        self.loaded = False
+
+    def _on_notify(self, conn: Any, pid: int, channel: str, payload: str) -> None:
+        task = asyncio.create_task(self._async_apply(payload))
+        self._updates.add(task)
+        task.add_done_callback(self._updates.discard)
+
+    async def _async_apply(self, payload: str) -> None:
+        try:
+            if payload == "*":
+                self.loaded = False
+                await self.async_refresh()
+            else:
+                await self.async_update([id for id in payload.split(",") if id])
+        except Exception as e:
+            self.logger.error(
+                f"Failed to update keyword index, reloading on next query: {str(e)}"
+            )
+            self.loaded = False
+
+    async def async_refresh(self) -> None:
+        """Load the index if it is not loaded or may have missed changes"""
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            if self._listener is None:
+                try:
+                    await self._async_listen()
+                except Exception as e:
+                    self.logger.error(
+                        f"Keyword index can not listen for changes: {str(e)}"
+                    )
+            async with self.pg.pool.acquire() as conn:
+                await self._async_load(conn)
+            # Without a listener, changes are picked up by reloading on every query
+            self.loaded = self._listener is not None
+
+    async def _async_load(self, conn: Any) -> None:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            keywords = await conn.fetch('SELECT id, keyword FROM keywords')
+            rows = await conn.fetch('''
+                SELECT r.id, r.created_at,
+                       COALESCE(
+                           array_agg(rk.keyword_id)
+                           FILTER (WHERE rk.keyword_id IS NOT NULL), '{}'
+                       ) AS keyword_ids
+                FROM "references" r
+                LEFT JOIN references_keywords rk ON rk.reference_id = r.id
+                GROUP BY r.id, r.created_at
+                ORDER BY r.created_at, r.id
+            ''')
+
+        self._reset()
+        for row in keywords:
+            self.keyword_ids[row["keyword"]] = row["id"]
+            self.keywords[row["id"]] = row["keyword"]
+        postings: Dict[int, List[int]] = {}
+        for ordinal, row in enumerate(rows):
+            self.reference_ids.append(row["id"])
+            self.ordinals[row["id"]] = ordinal
+            self.sort_keys.append((row["created_at"], row["id"]))
+            keyword_ids = tuple(row["keyword_ids"])
+            self.forward[ordinal] = keyword_ids
+            for keyword_id in keyword_ids:
+                postings.setdefault(keyword_id, []).append(ordinal)
+        self.postings = {
+            keyword_id: self._postings(ordinals, len(rows))
+            for keyword_id, ordinals in postings.items()
+        }
+        self.universe = _bitmap(range(len(rows)), len(rows))
+        self.logger.info(
+            f"Loaded keyword index: {len(rows)} references, "
+            f"{len(self.postings)} keywords"
+        )
+
+    @staticmethod
+    def _postings(ordinals: List[int], size: int) -> Postings:
+        # An array costs 4 bytes per ordinal, a bitmap 1 bit per reference
+        if len(ordinals) * 32 > size:
+            return _bitmap(ordinals, size)
+        return array("i", ordinals)
+
+    async def async_update(self, reference_ids: List[str]) -> None:
+        """Reload the keywords of the given references, removing deleted ones"""
+        async with self._lock:
+            async with self.pg.pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT r.id, r.created_at,
+                           COALESCE(
+                               array_agg(rk.keyword_id)
+                               FILTER (WHERE rk.keyword_id IS NOT NULL), '{}'
+                           ) AS keyword_ids
+                    FROM "references" r
+                    LEFT JOIN references_keywords rk ON rk.reference_id = r.id
+                    WHERE r.id = ANY($1::uuid[])
+                    GROUP BY r.id, r.created_at
+                ''', reference_ids)
+                found = {row["id"]: row for row in rows}
+                unknown = {
+                    k for row in rows for k in row["keyword_ids"]
+                    if k not in self.keywords
+                }
+                if unknown:
+                    for row in await conn.fetch(
+                        'SELECT id, keyword FROM keywords WHERE id = ANY($1::int[])',
+                        list(unknown),
+                    ):
+                        self.keyword_ids[row["keyword"]] = row["id"]
+                        self.keywords[row["id"]] = row["keyword"]
+
+            for reference_id in reference_ids:
+                row = found.get(reference_id)
+                ordinal = self.ordinals.get(reference_id)
+                if ordinal is not None:
+                    self._unset(ordinal)
+                if row is None:
+                    if ordinal is not None:
+                        del self.ordinals[reference_id]
+                        self.reference_ids[ordinal] = None
+                        self.sort_keys[ordinal] = None
+                        self.deleted += 1
+                    continue
+                if ordinal is None:
+                    ordinal = len(self.reference_ids)
+                    self.reference_ids.append(reference_id)
+                    self.sort_keys.append((row["created_at"], reference_id))
+                    self.ordinals[reference_id] = ordinal
+                self._set(ordinal, tuple(row["keyword_ids"]))
+
+            if self.deleted > self.COMPACT_RATIO * len(self.reference_ids):
+                # Renumber the ordinals with a reload before the next query
+                self.loaded = False
+
+    def _unset(self, ordinal: int) -> None:
+        for keyword_id in self.forward.pop(ordinal, ()):
+            postings = self.postings.get(keyword_id)
+            if postings is None:
+                continue
+            if isinstance(postings, bytearray):
+                _clear_bit(postings, ordinal)
+                continue
+            i = bisect.bisect_left(postings, ordinal)
+            if i < len(postings) and postings[i] == ordinal:
+                del postings[i]
+            if not postings:
+                del self.postings[keyword_id]
+        _clear_bit(self.universe, ordinal)
+
+    def _set(self, ordinal: int, keyword_ids: tuple[int, ...]) -> None:
+        self.forward[ordinal] = keyword_ids
+        size = len(self.reference_ids)
+        for keyword_id in keyword_ids:
+            postings = self.postings.get(keyword_id)
+            if postings is None:
+                self.postings[keyword_id] = array("i", [ordinal])
+            elif isinstance(postings, bytearray):
+                _set_bit(postings, ordinal)
+            else:
+                bisect.insort(postings, ordinal)
+                if len(postings) * 32 > size:
+                    self.postings[keyword_id] = _bitmap(postings, size)
+        _set_bit(self.universe, ordinal)
+
+    def _keyword_bitmap(self, keyword: str) -> int:
+        keyword_id = self.keyword_ids.get(keyword)
+        postings = self.postings.get(keyword_id) if keyword_id is not None else None
+        if postings is None:
+            return 0
+        if isinstance(postings, bytearray):
+            return int.from_bytes(postings, "little")
+        return int.from_bytes(_bitmap(postings, len(self.reference_ids)), "little")
+
+    def match_all(self, keywords: Iterable[str]) -> int:
+        """Bitmap of the references that have all of the keywords"""
+        result = None
+        for keyword in keywords:
+            bitmap = self._keyword_bitmap(keyword)
+            result = bitmap if result is None else result & bitmap
+            if not result:
+                return 0
+        return int.from_bytes(self.universe, "little") if result is None else result
+
+    def query(
+        self,
+        all_of: Optional[List[str]] = None,
+        any_of: Optional[List[str]] = None,
+        none_of: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Bitmap of the references with all keywords of `all_of`, one of `any_of`
+        and none of `none_of`
+        """
+        result = self.match_all(all_of or [])
+        if any_of:
+            union = 0
+            for keyword in any_of:
+                union |= self._keyword_bitmap(keyword)
+            result &= union
+        for keyword in none_of or []:
+            result &= ~self._keyword_bitmap(keyword)
+        return result
+
+    def reference_ids_for(self, bitmap: int) -> List[str]:
+        return [self.reference_ids[ordinal] for ordinal in _ordinals(bitmap)]
+
+    def page(
+        self,
+        bitmap: int,
+        limit: Optional[int] = None,
+        cursor: Optional[tuple[str, str]] = None,
+    ) -> List[str]:
+        """IDs of the matching references, newest first, after the keyset `cursor`"""
+        keys = (self.sort_keys[ordinal] for ordinal in _ordinals(bitmap))
+        if cursor is not None:
+            keys = (key for key in keys if key < cursor)
+        if limit is None:
+            ordered = sorted(keys, reverse=True)
+        else:
+            ordered = heapq.nlargest(limit, keys)
+        return [reference_id for _, reference_id in ordered]
+
+    def facet_counts(self, selected: List[str]) -> Dict[str, int]:
+        """
+        Keyword counts over the references that have all selected keywords,
+        highest first
+        """
+        matching = self.match_all(selected)
+        if not matching:
+            return {}
+
+        if matching.bit_count() <= self.FORWARD_COUNT_LIMIT:
+            counts: Counter[int] = Counter()
+            for ordinal in _ordinals(matching):
+                counts.update(self.forward.get(ordinal, ()))
+        else:
+            size = (matching.bit_length() + 7) // 8
+            matching_bytes = matching.to_bytes(size, "little")
+            counts = Counter()
+            for keyword_id, postings in self.postings.items():
+                if isinstance(postings, bytearray):
+                    bitmap = int.from_bytes(postings, "little") & matching
+                    counts[keyword_id] = bitmap.bit_count()
+                else:
+                    counts[keyword_id] = sum(
+                        1 for ordinal in postings
+                        if ordinal >> 3 < size
+                        and matching_bytes[ordinal >> 3] >> (ordinal & 7) & 1
+                    )
+        return {
+            self.keywords[keyword_id]: count
+            for keyword_id, count in counts.most_common()
+            if count > 0 and keyword_id in self.keywords
+        }
+
+def _bitmap(ordinals: Iterable[int], size: int) -> bytearray:
+    """Little endian bitmap of `size` bits with the bits of the given ordinals set"""
+    data = bytearray((size + 7) // 8)
+    for ordinal in ordinals:
+        data[ordinal >> 3] |= 1 << (ordinal & 7)
+    return data
+
+def _set_bit(data: bytearray, ordinal: int) -> None:
+    index = ordinal >> 3
+    if index >= len(data):
+        data.extend(bytes(index + 1 - len(data)))
+    data[index] |= 1 << (ordinal & 7)
+
+def _clear_bit(data: bytearray, ordinal: int) -> None:
+    index = ordinal >> 3
+    if index < len(data):
+        data[index] &= ~(1 << (ordinal & 7)) & 0xFF
+
+def _ordinals(bitmap: int) -> Iterable[int]:
+    """Set bit positions of a bitmap, lowest first"""
+    bits = bin(bitmap)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        yield position
+        position = bits.find("1", position + 1)
@@ -0,0 +1,200 @@
+import logging
+import math
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+
+from agents.keyword_index import NOTIFY_CHANNEL
+
+# Words ending in "s" that are not plurals, mostly names of technologies
+_SINGULAR_S = {
+    "series", "species", "news", "physics", "mathematics", "analytics",
+    "economics", "ethics", "statistics", "graphics", "robotics", "devops",
+    "mlops", "aws", "gcs", "dns", "https", "cors", "kubernetes", "postgres",
+    "redis", "jenkins", "pandas", "express", "windows", "ios", "macos", "chaos",
+    "canvas", "atlas", "alias", "bias", "focus", "corpus", "campus", "virus",
+    "lens",
+}
+# Endings that are usually not plurals (status, analysis, pandas, nodejs, ops)
+_SINGULAR_ENDINGS = ("ss", "us", "is", "as", "os", "js", "ps")
+
+def normalize_keyword(kw: str) -> str:
+    """
+    Normalize a keyword for storage
+    keywords should be lowercase. Spaces and '-` symbols should be replaced with
+    underscores.
+    """
+    return kw.strip().lower().replace(" ", "_").replace("-", "_")
+
+def _singular(word: str) -> str:
+    # Version numbers, file names and dotted names (next.js, web3, s3) are left alone
+    if len(word) <= 3 or not word.isalpha() or word in _SINGULAR_S:
+        return word
+    if word.endswith(_SINGULAR_ENDINGS):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "zzes")):
+        return word[:-2]
+    if word.endswith(("ches", "shes")) and word[-5] not in "aeiou":
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+def stem_keyword(keyword: str) -> str:
+    """
+    Canonical form of a normalized keyword: the head noun (last word) is made
+    singular, so `llms`/`llm` and `vector_databases`/`vector_database` match.
+    A conservative rule based singularizer, since no NLP library is available:
+    when in doubt a word is left as it is, aliases handle the rest.
+    """
+    head, sep, last = keyword.rpartition("_")
+    return f"{head}{sep}{_singular(last)}"
+
+def _aliased(keyword: str, aliases: Dict[str, str], forms: Dict[str, str]) -> bool:
+    return keyword in aliases or forms[keyword] in aliases
+
+def _canonical(keyword: str, aliases: Dict[str, str], forms: Dict[str, str]) -> str:
+    return aliases.get(keyword) or aliases.get(forms[keyword]) or forms[keyword]
+
+class KeywordNormalizer:
+    """
+    Canonicalizes the keywords extracted for a reference before they are stored.
+
+    Keywords are normalized and stemmed, then mapped through `keyword_aliases`
+    (canonical form -> keyword, e.g. `large_language_model` -> `llm`). Each
+    reference keeps at most `max_per_reference` keywords, ranked by TF-IDF: the
+    number of chunks mentioning the keyword, weighted by the inverse share of
+    indexed references that already have it.
+    """
+
+    def __init__(self, pg: Any, logger: logging.Logger, max_per_reference: int = 20):
+        self.pg = pg
+        self.logger = logger
+        self.max_per_reference = max_per_reference
+
+    async def _async_aliases(self, conn: Any, forms: Sequence[str]) -> Dict[str, str]:
+        rows = await conn.fetch(
+            'SELECT alias, keyword FROM keyword_aliases WHERE alias = ANY($1::text[])',
+            list(forms),
+        )
+        return {row["alias"]: row["keyword"] for row in rows}
+
+    async def async_canonicalize(
+        self, node_keywords: Sequence[Sequence[str]]
+    ) -> List[str]:
+        """
+        Canonical keywords of a reference from the raw keywords of each of its
+        chunks
+        """
+        per_node = []
+        for keywords in node_keywords:
+            normalized = {normalize_keyword(k) for k in keywords}
+            per_node.append({k for k in normalized if k})
+        forms = {k: stem_keyword(k) for node in per_node for k in node}
+        if not forms:
+            return []
+
+        async with self.pg.pool.acquire() as conn:
+            aliases = await self._async_aliases(
+                conn, list(set(forms.values()) | set(forms))
+            )
+
+            # Term frequency: number of chunks mentioning the keyword
+            tf: Counter[str] = Counter()
+            for node in per_node:
+                tf.update({_canonical(k, aliases, forms) for k in node})
+            if len(tf) <= self.max_per_reference:
+                return sorted(tf)
+
+            total = await conn.fetchval(
+                'SELECT count(*) FROM "references" WHERE indexed'
+            )
+            rows = await conn.fetch('''
+                SELECT k.keyword, c.count
+                FROM keywords k JOIN keyword_counts c ON c.keyword_id = k.id
+                WHERE k.keyword = ANY($1::text[])
+            ''', list(tf))
+        df = {row["keyword"]: row["count"] for row in rows}
+
+        scores = {
+            keyword: count * (math.log((1 + total) / (1 + df.get(keyword, 0))) + 1)
+            for keyword, count in tf.items()
+        }
+        kept = sorted(scores, key=lambda k: (-scores[k], k))[:self.max_per_reference]
+        self.logger.info(f"Kept {len(kept)} of {len(scores)} keywords by TF-IDF")
+        return sorted(kept)
+
+    async def async_merge_duplicates(
+        self, dry_run: bool = True
+    ) -> List[Tuple[str, List[str]]]:
+        """
+        Merge keywords that share a canonical form into one keyword, moving their
+        reference links. Returns the merged groups as (canonical keyword, merged
+        keywords). Only lists the groups unless `dry_run` is False.
+
+        A keyword without variants is only renamed if an alias maps it, so a
+        word the stemmer gets wrong is not rewritten on its own.
+        """
+        async with self.pg.pool.acquire() as conn:
+            async with conn.transaction():
+                keywords = await conn.fetch('''
+                    SELECT k.id, k.keyword, COALESCE(c.count, 0) AS count
+                    FROM keywords k LEFT JOIN keyword_counts c ON c.keyword_id = k.id
+                ''')
+                forms = {
+                    row["keyword"]: stem_keyword(row["keyword"]) for row in keywords
+                }
+                aliases = await self._async_aliases(
+                    conn, list(set(forms.values()) | set(forms))
+                )
+
+                groups: Dict[str, List[Any]] = {}
+                for row in keywords:
+                    keyword = row["keyword"]
+                    canonical = _canonical(keyword, aliases, forms)
+                    groups.setdefault(canonical, []).append(row)
+
+                merged = []
+                for canonical, rows in groups.items():
+                    if len(rows) == 1 and (
+                        rows[0]["keyword"] == canonical
+                        or not _aliased(rows[0]["keyword"], aliases, forms)
+                    ):
+                        continue
+                    target = next((r for r in rows if r["keyword"] == canonical), None)
+                    if target is None:
+                        target = max(rows, key=lambda r: (r["count"], -r["id"]))
+                    others = [r for r in rows if r["id"] != target["id"]]
+                    variants = sorted(
+                        r["keyword"] for r in rows if r["keyword"] != canonical
+                    )
+                    merged.append((canonical, variants))
+                    if dry_run:
+                        continue
+
+                    if others:
+                        other_ids = [r["id"] for r in others]
+                        await conn.execute('''
+                            INSERT INTO references_keywords (reference_id, keyword_id)
+                            SELECT reference_id, $1 FROM references_keywords
+                            WHERE keyword_id = ANY($2::int[])
+                            ON CONFLICT DO NOTHING
+                        ''', target["id"], other_ids)
+                        # Cascades to their reference links and counts
+                        await conn.execute(
+                            'DELETE FROM keywords WHERE id = ANY($1::int[])', other_ids
+                        )
+                    if target["keyword"] != canonical:
+                        await conn.execute(
+                            'UPDATE keywords SET keyword = $2 WHERE id = $1',
+                            target["id"],
+                            canonical,
+                        )
+
+                if merged and not dry_run:
+                    # Renames do not touch reference links, so reload keyword
+                    # indexes in full
+                    await conn.execute(f"SELECT pg_notify('{NOTIFY_CHANNEL}', '*')")
+                self.logger.info(f"Merged {len(merged)} keyword groups")
+                return merged
@@ -1,8 +1,15 @@
+import logging
 from typing import Any
 
+from agents.keyword_index import KeywordIndex
+from agents.keyword_normalizer import KeywordNormalizer
+
+
 class KeywordsStore:
-    def __init__(self, pg: Any):
+    def __init__(self, pg: Any, logger: logging.Logger, max_per_reference: int = 20):
         self.pg = pg
+        self.index = KeywordIndex(pg, logger)
+        self.normalizer = KeywordNormalizer(pg, logger, max_per_reference)
         
     async def async_list_keywords(self) -> list[str]:
         async with self.pg.pool.acquire() as conn:
@@ -20,46 +27,29 @@ class KeywordsStore:
             return [row['keyword'] for row in result]
         
     async def async_get_reference_ids_for_keywords(self, keywords: list[str]) -> list[str]:
-        async with self.pg.pool.acquire() as conn:
-            result = await conn.fetch('''
-                SELECT rk.reference_id
-                FROM references_keywords rk
-                JOIN keywords k ON rk.keyword_id = k.id
-                WHERE k.keyword = ANY($1)
-            ''', keywords)
-            return [row['reference_id'] for row in result]
+        """IDs of the references that have any of the keywords, each listed once"""
+        await self.index.async_refresh()
+        return self.index.reference_ids_for(self.index.query(any_of=keywords))
         
     async def async_get_keywords_counts(self, selected_tags: list[str] = None) -> dict[str, int]:
+        """
+        Number of references per keyword, highest first. With selected tags, only
+        references that have all of them are counted.
+
+        Overall counts are read from `keyword_counts`, which triggers on
+        `references_keywords` keep current. Counts for selected tags are computed
+        from the in-memory keyword index without a database query.
+        """
+        if selected_tags:
+            await self.index.async_refresh()
+            return self.index.facet_counts(selected_tags)
+
         async with self.pg.pool.acquire() as conn:
-            if selected_tags:
-                result = await conn.fetch('''
-                    WITH filtered_refs AS (
-                        SELECT r.id
-                        FROM "references" r
-                        JOIN references_keywords rk ON r.id = rk.reference_id
-                        JOIN keywords k ON rk.keyword_id = k.id
-                        WHERE k.keyword = ANY($1)
-                        GROUP BY r.id
-                        HAVING COUNT(DISTINCT k.keyword) = $2
-                    )
-                    SELECT k.keyword, COUNT(DISTINCT rk.reference_id) as count
-                    FROM keywords k
-                    JOIN references_keywords rk ON k.id = rk.keyword_id
-                    JOIN filtered_refs fr ON rk.reference_id = fr.id
-                    GROUP BY k.keyword
-                    ORDER BY count DESC
-                ''', selected_tags, len(selected_tags))
-                
-                if not result:
-                    return {}  # No references match all selected tags
-            else:
-                # Get all keyword counts if no tags are selected
-                result = await conn.fetch('''
-                    SELECT k.keyword, COUNT(rk.reference_id) as count
-                    FROM keywords k
-                    JOIN references_keywords rk ON k.id = rk.keyword_id
-                    GROUP BY k.keyword
-                    ORDER BY count DESC
-                ''')
-            
+            result = await conn.fetch('''
+                SELECT k.keyword, c.count
+                FROM keyword_counts c
+                JOIN keywords k ON k.id = c.keyword_id
+                WHERE c.count > 0
+                ORDER BY c.count DESC
+            ''')
             return {row['keyword']: row['count'] for row in result}
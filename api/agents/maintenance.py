@@ -0,0 +1,204 @@
+import logging
+from typing import Any, Dict, List
+
+import env
+from agents.vector_store import VectorIndexConfig
+
+# Schema and table names of the llama_index stores. The Postgres stores prefix
+# their tables with `data_`.
+STORE_SCHEMA = "agentstore"
+DOCUMENTS_TABLE = "documents"
+VECTORS_TABLE = "vectors"
+CACHE_TABLE = "cache"
+
+def _table(name: str) -> str:
+    return f'{STORE_SCHEMA}."data_{name}"'
+
+VECTOR_INDEX_NAME = f"data_{VECTORS_TABLE}_embedding_ann_idx"
+TEXT_SEARCH_INDEX_NAME = f"data_{VECTORS_TABLE}_text_search_idx"
+TEXT_SEARCH_CONFIG = "english"
+
+# Only rows that belong to references are considered for cleanup. Other
+# documents (e.g. from tools) use IDs that are not UUIDs.
+_UUID_PATTERN = '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+# Ingestion cache entries hold the serialized output nodes, whose source
+# relationship ("1") points at the reference.
+_CACHE_SOURCE_ID = "c.value->'nodes'->0->'__data__'->'relationships'->'1'->>'node_id'"
+
+async def async_delete_reference_nodes(conn: Any, reference_ids: List[str]) -> None:
+    """
+    Delete the chunks and documents of the given references from the vector store
+    and docstore. Runs on the given connection, so callers can delete the
+    references themselves in the same transaction.
+    """
+    await conn.execute(f'''
+        DELETE FROM {_table(VECTORS_TABLE)}
+        WHERE metadata_->>'ref_doc_id' = ANY($1::text[])
+    ''', reference_ids)
+    # Document data, ref doc info and metadata (hash) are all keyed by the document ID
+    await conn.execute(f'''
+        DELETE FROM {_table(DOCUMENTS_TABLE)}
+        WHERE key = ANY($1::text[])
+    ''', reference_ids)
+
+def _index(name: str) -> str:
+    return f"{STORE_SCHEMA}.{name}"
+
+async def _async_drop_invalid_index(
+    conn: Any, logger: logging.Logger, name: str
+) -> bool:
+    """
+    Whether the index exists. An invalid index, left behind by a failed or
+    interrupted CREATE INDEX CONCURRENTLY, is not used by queries, so it is
+    dropped and reported as missing.
+    """
+    valid = await conn.fetchval(
+        'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)',
+        _index(name),
+    )
+    if valid is False:
+        logger.warning(f"Dropping invalid index {name}")
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {_index(name)}')
+        return False
+    return valid is not None
+
+class StoreMaintenance:
+    """Maintenance tasks for the llama_index stores, run via `manage.py`"""
+
+    def __init__(self, pg: Any, logger: logging.Logger):
+        self.pg = pg
+        self.logger = logger
+
+    async def async_gc(self, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Remove rows of the vector store, docstore and ingestion cache that belong
+        to references which no longer exist, expired chat cache entries and
+        conversation summaries that were not used for a while.
+        Returns the number of removed rows per store.
+        """
+        queries = {
+            "vectors": f'''
+                FROM {_table(VECTORS_TABLE)} v
+                WHERE v.metadata_->>'ref_doc_id' ~ '{_UUID_PATTERN}'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM public."references" r
+                      WHERE r.id = (v.metadata_->>'ref_doc_id')::uuid
+                  )
+            ''',
+            "documents": f'''
+                FROM {_table(DOCUMENTS_TABLE)} d
+                WHERE d.key ~ '{_UUID_PATTERN}'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM public."references" r WHERE r.id = d.key::uuid
+                  )
+            ''',
+            "cache": f'''
+                FROM {_table(CACHE_TABLE)} c
+                WHERE {_CACHE_SOURCE_ID} ~ '{_UUID_PATTERN}'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM public."references" r
+                      WHERE r.id = ({_CACHE_SOURCE_ID})::uuid
+                  )
+            ''',
+            "chat_cache": '''
+                FROM chat_cache WHERE expires_at <= now()
+            ''',
+            "chat_summaries": f'''
+                FROM chat_summaries
+                WHERE used_at < now()
+                    - interval '{int(env.CHAT_SUMMARY_RETENTION_DAYS)} days'
+            ''',
+        }
+
+        counts = {}
+        async with self.pg.pool.acquire() as conn:
+            async with conn.transaction():
+                for store, query in queries.items():
+                    if dry_run:
+                        counts[store] = await conn.fetchval(f'SELECT count(*) {query}')
+                    else:
+                        status = await conn.execute(f'DELETE {query}')
+                        counts[store] = int(status.split()[-1])
+                    self.logger.info(f"Orphaned rows in {store}: {counts[store]}")
+        return counts
+
+    async def async_build_vector_index(
+        self, config: VectorIndexConfig, rebuild: bool = False
+    ) -> None:
+        """
+        Create the ANN index on the vector store embeddings without blocking
+        writes.
+
+        With `rebuild`, a new index is built next to the existing one and swapped
+        in, so searches keep using the old index until the new one is ready. With
+        index type `none`, the index is dropped.
+        """
+        method = config.index_method()
+        async with self.pg.pool.acquire() as conn:
+            exists = await _async_drop_invalid_index(
+                conn, self.logger, VECTOR_INDEX_NAME
+            )
+            if method is None:
+                self.logger.info(f"Dropping vector index {VECTOR_INDEX_NAME}")
+                await conn.execute(
+                    f'DROP INDEX CONCURRENTLY IF EXISTS {_index(VECTOR_INDEX_NAME)}'
+                )
+                return
+            if exists and not rebuild:
+                self.logger.info(f"Vector index {VECTOR_INDEX_NAME} already exists")
+                return
+
+            # CREATE INDEX CONCURRENTLY can not run inside a transaction block, so
+            # every statement is executed on its own.
+            name = f"{VECTOR_INDEX_NAME}_new" if exists else VECTOR_INDEX_NAME
+            await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {_index(name)}')
+            self.logger.info(f"Building vector index {name} using {method}")
+            await conn.execute(f'''
+                CREATE INDEX CONCURRENTLY {name}
+                ON {_table(VECTORS_TABLE)} USING {method}
+            ''')
+            if exists:
+                await conn.execute(
+                    f'DROP INDEX CONCURRENTLY {_index(VECTOR_INDEX_NAME)}'
+                )
+                await conn.execute(
+                    f'ALTER INDEX {_index(name)} RENAME TO {VECTOR_INDEX_NAME}'
+                )
+            self.logger.info(f"Vector index {VECTOR_INDEX_NAME} is ready")
+
+    async def async_build_text_search_index(
+        self, text_search_config: str = TEXT_SEARCH_CONFIG
+    ) -> None:
+        """
+        Add the generated `text_search_tsv` column and its GIN index to the vector
+        store, used by the hybrid retriever. Tables created with hybrid search
+        enabled already have the column; the index is built without blocking
+        writes.
+        """
+        async with self.pg.pool.acquire() as conn:
+            column = await conn.fetchval('''
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = $1
+                  AND table_name = $2
+                  AND column_name = 'text_search_tsv'
+            ''', STORE_SCHEMA, f"data_{VECTORS_TABLE}")
+            if not column:
+                # Computing the column rewrites the table
+                self.logger.info(
+                    f"Adding text_search_tsv column to {_table(VECTORS_TABLE)}"
+                )
+                await conn.execute(f'''
+                    ALTER TABLE {_table(VECTORS_TABLE)}
+                    ADD COLUMN text_search_tsv tsvector
+                    GENERATED ALWAYS AS (
+                        to_tsvector('{text_search_config}', text)
+                    ) STORED
+                ''')
+
+            await _async_drop_invalid_index(conn, self.logger, TEXT_SEARCH_INDEX_NAME)
+            self.logger.info(f"Building text search index {TEXT_SEARCH_INDEX_NAME}")
+            await conn.execute(f'''
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS {TEXT_SEARCH_INDEX_NAME}
+                ON {_table(VECTORS_TABLE)} USING gin (text_search_tsv)
+            ''')
+            self.logger.info(f"Text search index {TEXT_SEARCH_INDEX_NAME} is ready")
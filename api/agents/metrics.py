@@ -0,0 +1,287 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.utils import get_tokenizer
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200)
+# Connection pool acquire wait buckets in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(dict(key))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for bound, count in zip(self.buckets, self.counts, strict=True):
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class Gauge:
+    """A value read when the metrics are rendered"""
+
+    def __init__(self, name: str, help: str, value: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.value = value
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.value()}",
+        ]
+
+class _TimedAcquire:
+    def __init__(self, acquire: Any, wait_seconds: Histogram):
+        self.acquire = acquire
+        self.wait_seconds = wait_seconds
+
+    async def __aenter__(self) -> Any:
+        start = time.perf_counter()
+        conn = await self.acquire.__aenter__()
+        self.wait_seconds.observe(time.perf_counter() - start)
+        return conn
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.acquire.__aexit__(*exc)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def _acquire(self) -> Any:
+        start = time.perf_counter()
+        conn = await self.acquire
+        self.wait_seconds.observe(time.perf_counter() - start)
+        return conn
+
+class InstrumentedPool:
+    """asyncpg pool that records how long `acquire` waits for a connection"""
+
+    def __init__(self, pool: Any, wait_seconds: Histogram):
+        self._pool = pool
+        self.wait_seconds = wait_seconds
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _TimedAcquire:
+        return _TimedAcquire(self._pool.acquire(timeout=timeout), self.wait_seconds)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+class Metrics:
+    """
+    Process-local metrics in the Prometheus text format, served by `/metrics`.
+
+    Only created when METRICS_ENABLED is set; with metrics disabled the chat path
+    does not create traces, so it does no extra work.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.tokenizer = get_tokenizer()
+        self.chat_requests = Counter(
+            "chat_requests_total", "Chat requests by response cache result"
+        )
+        self.chat_errors = Counter("chat_errors_total", "Chat streams that failed")
+        self.retrieval_seconds = Histogram(
+            "chat_retrieval_seconds", "Retrieval latency per chat request"
+        )
+        self.setup_seconds = Histogram(
+            "chat_setup_seconds",
+            "Time from request to the start of the LLM stream "
+            "(history, condense, retrieval)",
+        )
+        self.ttft_seconds = Histogram(
+            "chat_time_to_first_token_seconds", "Time from request to the first token"
+        )
+        self.stream_seconds = Histogram(
+            "chat_stream_seconds", "Total duration of the response stream"
+        )
+        self.tokens_per_second = Histogram(
+            "chat_completion_tokens_per_second",
+            "Completion tokens per second after the first token",
+            RATE_BUCKETS,
+        )
+        self.prompt_tokens = Counter(
+            "chat_prompt_tokens_total", "Estimated prompt tokens of chat requests"
+        )
+        self.completion_tokens = Counter(
+            "chat_completion_tokens_total", "Completion tokens of chat responses"
+        )
+        self._metrics = [
+            self.chat_requests,
+            self.chat_errors,
+            self.retrieval_seconds,
+            self.setup_seconds,
+            self.ttft_seconds,
+            self.stream_seconds,
+            self.tokens_per_second,
+            self.prompt_tokens,
+            self.completion_tokens,
+        ]
+
+    def register(self, metric: Counter | Histogram | Gauge) -> None:
+        self._metrics.append(metric)
+
+    def instrument_pool(self, pool: Any) -> InstrumentedPool:
+        """
+        Report connections in use, idle connections and acquire waits of an
+        asyncpg pool
+        """
+        wait_seconds = Histogram(
+            "db_pool_acquire_wait_seconds",
+            "Time waited to acquire a pool connection",
+            WAIT_BUCKETS,
+        )
+        self.register(
+            Gauge("db_pool_size", "Open connections of the pool", pool.get_size)
+        )
+        self.register(Gauge(
+            "db_pool_max_size", "Maximum connections of the pool", pool.get_max_size
+        ))
+        self.register(
+            Gauge("db_pool_idle", "Idle connections of the pool", pool.get_idle_size)
+        )
+        self.register(Gauge(
+            "db_pool_in_use",
+            "Connections of the pool acquired by a request or job",
+            lambda: pool.get_size() - pool.get_idle_size(),
+        ))
+        self.register(wait_seconds)
+        return InstrumentedPool(pool, wait_seconds)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def chat_trace(self) -> "ChatTrace":
+        return ChatTrace(self)
+
+class ChatTrace:
+    """Timings and token counts of one chat request"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.cache = "disabled"
+        self.retrieval: Optional[float] = None
+        self.setup: Optional[float] = None
+        self.prompt_tokens = 0
+
+    def retrieved(self, seconds: float) -> None:
+        self.retrieval = (self.retrieval or 0) + seconds
+
+    def prompt(self, texts: Sequence[str]) -> None:
+        self.prompt_tokens += sum(
+            self.metrics.count_tokens(text) for text in texts if text
+        )
+
+    async def stream(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Pass the response stream through, recording the stream metrics when it
+        ends
+        """
+        self.setup = time.perf_counter() - self.start
+        first = None
+        parts = []
+        error = False
+        try:
+            async for part in stream:
+                if first is None:
+                    first = time.perf_counter()
+                parts.append(part)
+                yield part
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self._finish(first, "".join(parts), error)
+
+    def _finish(self, first: Optional[float], text: str, error: bool) -> None:
+        m = self.metrics
+        end = time.perf_counter()
+        completion_tokens = m.count_tokens(text)
+        ttft = first - self.start if first is not None else None
+        rate = None
+        if first is not None and end > first and completion_tokens > 1:
+            rate = (completion_tokens - 1) / (end - first)
+
+        m.chat_requests.inc(cache=self.cache)
+        if error:
+            m.chat_errors.inc()
+        if self.retrieval is not None:
+            m.retrieval_seconds.observe(self.retrieval)
+        m.setup_seconds.observe(self.setup)
+        if ttft is not None:
+            m.ttft_seconds.observe(ttft)
+        m.stream_seconds.observe(end - self.start - self.setup)
+        if rate is not None:
+            m.tokens_per_second.observe(rate)
+        m.prompt_tokens.inc(self.prompt_tokens)
+        m.completion_tokens.inc(completion_tokens)
+
+        m.logger.info(json.dumps({
+            "event": "chat_metrics",
+            "cache": self.cache,
+            "error": error,
+            "retrieval_seconds": self.retrieval,
+            "setup_seconds": round(self.setup, 4),
+            "ttft_seconds": round(ttft, 4) if ttft is not None else None,
+            "stream_seconds": round(end - self.start - self.setup, 4),
+            "total_seconds": round(end - self.start, 4),
+            "tokens_per_second": round(rate, 1) if rate is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }))
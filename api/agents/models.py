@@ -1,7 +1,7 @@
-import env
-
-from llama_index.llms.openai import OpenAI
 from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.llms.openai import OpenAI
+
+import env
 
 openai_gpt4o_mini = OpenAI(
     model="gpt-4o-mini",
@@ -10,3 +10,8 @@ openai_gpt4o_mini = OpenAI(
 )
 
 openai_embeddings = OpenAIEmbedding(api_key=env.OPENAI_API_KEY)
+
+# LLMs that can be selected by name, e.g. per indexing stage
+llms = {
+    "gpt-4o-mini": openai_gpt4o_mini,
+}
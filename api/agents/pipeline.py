@@ -0,0 +1,267 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from llama_index.core import StorageContext
+from llama_index.core.extractors import (
+    KeywordExtractor,
+    SummaryExtractor,
+    TitleExtractor,
+)
+from llama_index.core.ingestion import IngestionCache
+from llama_index.core.ingestion.pipeline import arun_transformations
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    NodeRelationship,
+    TransformComponent,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from llama_index.storage.kvstore.postgres import PostgresKVStore
+from pydantic import BaseModel
+
+from agents.maintenance import STORE_SCHEMA, VECTORS_TABLE
+from agents.summaries import ReferenceSummarizer
+
+
+class ExtractorSettings(BaseModel):
+    """Settings for a single LLM metadata extractor stage"""
+    enabled: bool = True
+    max_tokens: int
+    # Model name as understood by Models.get_llm. None selects the default model.
+    model: Optional[str] = None
+
+class IndexingProfile(BaseModel):
+    """
+    Per-stage settings of the indexing pipeline.
+
+    Profiles trade LLM cost against metadata quality. The default profile runs
+    all extractors, while the cheap profile is meant for bulk imports and only
+    computes the per-chunk summaries.
+    """
+    chunk_size: int = 1024
+    chunk_overlap: int = 200
+    title: ExtractorSettings = ExtractorSettings(max_tokens=40)
+    summary: ExtractorSettings = ExtractorSettings(max_tokens=250)
+    keywords: ExtractorSettings = ExtractorSettings(max_tokens=100)
+
+DEFAULT_PROFILE = "default"
+
+PROFILES: Dict[str, IndexingProfile] = {
+    "default": IndexingProfile(),
+    "cheap": IndexingProfile(
+        title=ExtractorSettings(enabled=False, max_tokens=40),
+        keywords=ExtractorSettings(enabled=False, max_tokens=100),
+    ),
+}
+
+class IndexingPipeline:
+    """
+    Node ingestion pipelines shared by all indexing tasks.
+
+    The transformations for each profile are built once per process and reused
+    for every document, instead of being recreated on every `_index_reference`
+    call. The reference-level summary is computed by `summarizer` from the nodes
+    the pipeline produced.
+
+    Indexing is incremental: chunks get IDs derived from their text, and only
+    chunks that are not yet in the vector store for the document are run through
+    the extractors and the embedding model. Chunks that no longer exist are
+    deleted, so reindex cost scales with the size of the change.
+
+    The document title is extracted from the first chunks of the document. While
+    those are unchanged the stored title is reused, otherwise it is extracted
+    again and updated on the stored chunks (their embeddings are not recomputed).
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        models: Any,
+        cache_store: PostgresKVStore,
+        storage: StorageContext,
+        profiles: Dict[str, IndexingProfile] = PROFILES,
+        default_profile: str = DEFAULT_PROFILE,
+        summarizer: Optional[ReferenceSummarizer] = None,
+    ):
+        if default_profile not in profiles:
+            raise ValueError(f"Invalid indexing profile: {default_profile}")
+
+        self.pg = pg
+        self.models = models
+        self.storage = storage
+        self.profiles = profiles
+        self.default_profile = default_profile
+        self.cache = IngestionCache(cache=cache_store)
+        self.summarizer = summarizer or ReferenceSummarizer(models.get_llm())
+        self._transformations: Dict[str, List[TransformComponent]] = {
+            name: self._build_transformations(profile)
+            for name, profile in profiles.items()
+        }
+
+    def profile(self, name: str | None = None) -> IndexingProfile:
+        return self.profiles[self._profile_name(name)]
+
+    def transformations(self, name: str | None = None) -> List[TransformComponent]:
+        return self._transformations[self._profile_name(name)]
+
+    async def arun(self, doc: Document, profile: str | None = None) -> List[BaseNode]:
+        """
+        Split, enrich and embed a document, storing the nodes in the vector store.
+        Returns all nodes of the document in order, including unchanged ones.
+        """
+        name = self._profile_name(profile)
+        splitter, *transformations = self.transformations(name)
+        titles = (t for t in transformations if isinstance(t, TitleExtractor))
+        title = next(titles, None)
+        transformations = [t for t in transformations if t is not title]
+        vector_store = self.storage.vector_store
+
+        nodes = await splitter.acall([doc])
+        _assign_chunk_ids(nodes, doc.id_, name)
+
+        existing = await self._async_existing_nodes(doc.id_)
+        changed = [node for node in nodes if node.node_id not in existing]
+        stale = list(existing.keys() - {node.node_id for node in nodes})
+
+        if changed:
+            if title is not None:
+                await self._async_title(title, nodes, changed, existing)
+            changed = await arun_transformations(
+                changed, transformations, cache=self.cache, show_progress=True
+            )
+            await vector_store.async_add(changed)
+        if stale:
+            await vector_store.adelete_nodes(node_ids=stale)
+
+        await self.storage.docstore.async_add_documents([doc])
+        await self.storage.docstore.aset_document_hash(doc.id_, doc.hash)
+
+        processed = {node.node_id: node for node in changed}
+        return [processed.get(node.node_id) or existing[node.node_id] for node in nodes]
+
+    async def asummarize(
+        self, reference_type: str, doc: Document, nodes: List[BaseNode]
+    ) -> str:
+        """Summarize a whole reference using the strategy configured for its type"""
+        return await self.summarizer.asummarize(reference_type, doc, nodes)
+
+    async def _async_existing_nodes(self, doc_id: str) -> Dict[str, BaseNode]:
+        """Stored chunks of a document, without their embeddings"""
+        # The vector store's aget_nodes runs its sync implementation, so query
+        # through asyncpg
+        async with self.pg.pool.acquire() as conn:
+            rows = await conn.fetch(f'''
+                SELECT node_id, text, metadata_
+                FROM {STORE_SCHEMA}."data_{VECTORS_TABLE}"
+                WHERE metadata_->>'ref_doc_id' = $1
+            ''', doc_id)
+
+        nodes = {}
+        for row in rows:
+            metadata = row["metadata_"]
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            node = metadata_dict_to_node(metadata)
+            node.set_content(row["text"])
+            nodes[row["node_id"]] = node
+        return nodes
+
+    async def _async_title(
+        self,
+        extractor: TitleExtractor,
+        nodes: List[BaseNode],
+        changed: List[BaseNode],
+        existing: Dict[str, BaseNode],
+    ) -> None:
+        """Set the document title on the changed chunks"""
+        first = nodes[:extractor.nodes_to_consider]
+        previous = {
+            existing[node.node_id].metadata.get("document_title")
+            for node in first if node.node_id in existing
+        }
+        unchanged = all(node.node_id in existing for node in first)
+        if unchanged and len(previous) == 1 and None not in previous:
+            title = previous.pop()
+        else:
+            title = (await extractor.aextract(first))[0]["document_title"]
+            outdated = [
+                node_id for node_id, node in existing.items()
+                if node.metadata.get("document_title") != title
+            ]
+            if outdated:
+                # The title is stored in the metadata column and in the serialized node
+                async with self.pg.pool.acquire() as conn:
+                    await conn.execute(f'''
+                        UPDATE {STORE_SCHEMA}."data_{VECTORS_TABLE}"
+                        SET metadata_ = jsonb_set(
+                            jsonb_set(
+                                metadata_, '{{document_title}}', to_jsonb($2::text)
+                            ),
+                            '{{_node_content}}',
+                            to_jsonb(jsonb_set(
+                                (metadata_->>'_node_content')::jsonb,
+                                '{{metadata,document_title}}',
+                                to_jsonb($2::text)
+                            )::text)
+                        )
+                        WHERE node_id = ANY($1::text[])
+                    ''', outdated, title)
+                for node_id in outdated:
+                    existing[node_id].metadata["document_title"] = title
+
+        for node in changed:
+            node.metadata["document_title"] = title
+
+    def _profile_name(self, name: str | None) -> str:
+        name = name or self.default_profile
+        if name not in self.profiles:
+            raise ValueError(f"Invalid indexing profile: {name}")
+        return name
+
+    def _build_transformations(
+        self, profile: IndexingProfile
+    ) -> List[TransformComponent]:
+        transformations: List[TransformComponent] = [
+            SentenceSplitter(
+                chunk_size=profile.chunk_size, chunk_overlap=profile.chunk_overlap
+            ),
+        ]
+        if profile.title.enabled:
+            transformations.append(TitleExtractor(
+                llm=self.models.get_llm(profile.title.model),
+                max_tokens=profile.title.max_tokens,
+            ))
+        if profile.summary.enabled:
+            transformations.append(SummaryExtractor(
+                llm=self.models.get_llm(profile.summary.model),
+                summaries=["self"],
+                max_tokens=profile.summary.max_tokens,
+            ))
+        if profile.keywords.enabled:
+            transformations.append(KeywordExtractor(
+                llm=self.models.get_llm(profile.keywords.model),
+                max_tokens=profile.keywords.max_tokens,
+            ))
+        transformations.append(self.models.embeddings)
+        return transformations
+
+def _assign_chunk_ids(nodes: List[BaseNode], doc_id: str, profile: str) -> None:
+    """
+    Replace the random node IDs from the splitter with IDs derived from the
+    document, the indexing profile and the chunk text, so unchanged chunks keep
+    their ID across reindexing. Previous/next relationships are rebuilt.
+    """
+    seen: Dict[str, int] = {}
+    for node in nodes:
+        content = f"{profile}\0{node.get_content()}".encode()
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        # Identical chunks within a document are told apart by their occurrence
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        node.id_ = f"{doc_id}_{digest}_{occurrence}"
+
+    for prev, node in zip(nodes, nodes[1:], strict=False):
+        node.relationships[NodeRelationship.PREVIOUS] = prev.as_related_node_info()
+        prev.relationships[NodeRelationship.NEXT] = node.as_related_node_info()
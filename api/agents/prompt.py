@@ -1,20 +1,60 @@
-from typing import List, Optional, Union, Dict, Any, Literal
-from pydantic import BaseModel, Field
 import base64
-from llama_index.core.base.llms.types import TextBlock, ImageBlock, AudioBlock
+import json
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from llama_index.core.base.llms.types import AudioBlock, ImageBlock, TextBlock
 from llama_index.core.llms import ChatMessage
+from pydantic import BaseModel, ConfigDict
 
 
 # Content Parts
 class ContentPart(BaseModel):
-    """Base class for message content parts"""
+    """
+    Base class for message content parts
+
+    Message content lists are parsed as ContentPart, so the fields of the
+    concrete part are kept and `typed()` converts it by its `type`.
+    """
+    model_config = ConfigDict(extra="allow")
     type: str
+
+    def typed(self) -> "ContentPart":
+        """The part as the class of its `type`"""
+        cls = PART_TYPES.get(self.type)
+        if cls is None:
+            raise ValueError(f"Unknown content part type: {self.type}")
+        if isinstance(self, cls):
+            return self
+        return cls.model_validate(self.model_dump())
     
     def to_block(self):
-        raise NotImplementedError("Subclasses must implement this method")
+        part = self.typed()
+        if part is self:
+            raise NotImplementedError("Subclasses must implement this method")
+        return part.to_block()
     
     def content_str(self) -> str:
-        raise NotImplementedError("Subclasses must implement this method")
+        part = self.typed()
+        if part is self:
+            raise NotImplementedError("Subclasses must implement this method")
+        return part.content_str()
+
+    def truncate(self, max_chars: int) -> "ContentPart":
+        """
+        Return the part, or a shortened text version of it if it is an oversized
+        tool or file part
+        """
+        part = self.typed()
+        if part is self:
+            return self
+        return part.truncate(max_chars)
+
+def _truncated_text(part: ContentPart, max_chars: int) -> ContentPart:
+    text = part.content_str()
+    if len(text) <= max_chars:
+        return part
+    truncated = len(text) - max_chars
+    return TextPart(text=f"{text[:max_chars]}\n[truncated {truncated} characters]")
 
 class TextPart(ContentPart):
     """
@@ -100,6 +140,13 @@ class FilePart(ContentPart):
     def content_str(self) -> str:
         return self.data
 
+    def truncate(self, max_chars: int) -> ContentPart:
+        is_text = bool(self.mimeType and self.mimeType.startswith("text/"))
+        if self.data.startswith("data:") and not is_text:
+            # Binary files are sent as blocks, not as text
+            return self
+        return _truncated_text(self, max_chars)
+
 class ToolCallPart(ContentPart):
     """
     Represents a tool call content part, typically generated by the AI model.
@@ -132,6 +179,9 @@ class ToolCallPart(ContentPart):
             }
         })
 
+    def truncate(self, max_chars: int) -> ContentPart:
+        return _truncated_text(self, max_chars)
+
 class ToolResultPart(ContentPart):
     """
     Represents the result of a tool call in a tool message.
@@ -166,13 +216,35 @@ class ToolResultPart(ContentPart):
         }
         if self.isError:
             doc["tool_result"]["is_error"] = self.isError
-        return TextBlock(text=json.dumps(doc))
+        return json.dumps(doc, default=str)
+
+    def truncate(self, max_chars: int) -> ContentPart:
+        return _truncated_text(self, max_chars)
+
+PART_TYPES: Dict[str, type[ContentPart]] = {
+    "text": TextPart,
+    "image": ImagePart,
+    "file": FilePart,
+    "tool-call": ToolCallPart,
+    "tool-result": ToolResultPart,
+}
 
 # Message Types
 class CoreMessage(BaseModel):
     """Base class for all message types"""
     role: str
 
+    def truncate(self, max_chars: int) -> "CoreMessage":
+        """
+        Copy of the message with oversized tool and file parts shortened to
+        `max_chars`
+        """
+        content = getattr(self, "content", None)
+        if not isinstance(content, list):
+            return self
+        truncated = [part.truncate(max_chars) for part in content]
+        return self.model_copy(update={"content": truncated})
+
 class CoreSystemMessage(CoreMessage):
     """
     A system message that can contain system information.
@@ -1,11 +1,284 @@
-from markitdown import MarkItDown
-from llama_index.core.schema import Document
+import asyncio
+import hashlib
+import io
+import mimetypes
+import multiprocessing
+import os
+from multiprocessing.connection import Connection
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
 from llama_index.core.readers.base import BaseReader
+from llama_index.core.schema import Document
+from markitdown import MarkItDown, StreamInfo
+from pydantic import BaseModel
+
+
+class FetchResult(BaseModel):
+    """
+    Result of fetching and converting a document.
+
+    `text` is None if the document did not change since the fetch described by
+    the validators passed in, in which case it was not converted again.
+    """
+    text: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # sha256 of the raw document bytes and of the converted markdown
+    content_hash: Optional[str] = None
+    markdown_hash: Optional[str] = None
+
+    @property
+    def modified(self) -> bool:
+        return self.text is not None
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# MarkItDown instance of the current process, created on first use
+_markitdown: Optional[MarkItDown] = None
+
+def _convert(data: bytes, stream_info: StreamInfo) -> str:
+    """Convert a document to markdown. Runs in a conversion worker process."""
+    global _markitdown
+    if _markitdown is None:
+        _markitdown = MarkItDown()
+    result = _markitdown.convert_stream(io.BytesIO(data), stream_info=stream_info)
+    return result.text_content
+
+def _work(conn: Connection) -> None:
+    """
+    Conversion worker process: converts the documents sent over `conn` until it
+    is closed
+    """
+    while True:
+        try:
+            data, stream_info = conn.recv()
+        except EOFError:
+            return
+        try:
+            result: tuple[bool, Any] = (True, _convert(data, stream_info))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception:
+            # The exception could not be pickled
+            conn.send((False, RuntimeError(str(result[1]))))
+
+async def _async_read_url(
+    url: str,
+    max_bytes: int,
+    timeout: float,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> tuple[Optional[bytes], StreamInfo, Dict[str, Optional[str]]]:
+    """
+    Download a URL, sending a conditional request if validators are given.
+    Returns None as data if the server reports the document as not modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with (
+        httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client,
+        client.stream("GET", url, headers=headers) as response,
+    ):
+        validators = {
+            "etag": response.headers.get("etag", etag),
+            "last_modified": response.headers.get("last-modified", last_modified),
+        }
+        if response.status_code == 304:
+            return None, StreamInfo(url=url), validators
+        response.raise_for_status()
+        length = response.headers.get("content-length")
+        if length and int(length) > max_bytes:
+            raise ValueError(f"Document too large: {length} bytes (max {max_bytes})")
+
+        data = bytearray()
+        async for chunk in response.aiter_bytes(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError(f"Document too large: more than {max_bytes} bytes")
+
+        content_type = response.headers.get("content-type", "")
+        mimetype, _, params = content_type.partition(";")
+        charset = None
+        if "charset=" in params:
+            charset = params.split("charset=", 1)[1].strip().strip('"')
+        extension = os.path.splitext(urlsplit(url).path)[1] or None
+        if extension is None and mimetype:
+            extension = mimetypes.guess_extension(mimetype.strip())
+        return bytes(data), StreamInfo(
+            mimetype=mimetype.strip() or None,
+            charset=charset,
+            extension=extension,
+            url=url,
+        ), validators
+
+def _read_file(path: str, max_bytes: int) -> bytes:
+    size = os.path.getsize(path)
+    if size > max_bytes:
+        raise ValueError(f"Document too large: {size} bytes (max {max_bytes})")
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _async_fetch(
+    source: str,
+    max_bytes: int,
+    timeout: float,
+    convert: Callable[[bytes, StreamInfo], Awaitable[str]],
+    cached: Optional[Dict[str, Any]] = None,
+) -> FetchResult:
+    """
+    Fetch a document and convert it to markdown with `convert`.
+
+    Conversion is skipped if the server answers a conditional request with
+    304 Not Modified, or if the raw bytes hash to the cached content hash.
+    """
+    cached = cached or {}
+    content_hash = cached.get("content_hash")
+    if source.startswith(("http://", "https://")):
+        data, stream_info, validators = await _async_read_url(
+            source, max_bytes, timeout, cached.get("etag"), cached.get("last_modified")
+        )
+        if data is None:
+            return FetchResult(content_hash=content_hash, **validators)
+    else:
+        data = await asyncio.to_thread(_read_file, source, max_bytes)
+        stream_info = StreamInfo(
+            local_path=source,
+            filename=os.path.basename(source),
+            extension=os.path.splitext(source)[1] or None,
+        )
+        validators = {}
+
+    digest = _sha256(data)
+    if digest == content_hash:
+        return FetchResult(content_hash=digest, **validators)
+    text = await convert(data, stream_info)
+    return FetchResult(
+        text=text,
+        content_hash=digest,
+        markdown_hash=_sha256(text.encode()),
+        **validators,
+    )
+
+class _Worker:
+    """A conversion worker process and the parent end of its pipe"""
+
+    def __init__(self) -> None:
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self) -> None:
+        self.conn.close()
+        self.process.terminate()
+
+class ConversionPool:
+    """
+    Bounded pool of worker processes for converting documents with MarkItDown.
+
+    Conversion is CPU heavy and synchronous. Running it in worker processes keeps
+    the event loop responsive and lets conversions scale across cores. Each worker
+    process reuses a single MarkItDown instance. Documents are downloaded in the
+    event loop, so only the conversion occupies a worker.
+
+    The `timeout` of a conversion starts once a worker has the document, so time
+    spent waiting for a free worker does not count. A worker that exceeds it can
+    not be interrupted, so only that process is terminated and replaced.
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._slots = asyncio.Semaphore(self.max_workers)
+        # Started on demand and reused
+        self._idle: List[_Worker] = []
+
+    async def _async_convert(self, data: bytes, stream_info: StreamInfo) -> str:
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else _Worker()
+            try:
+                worker.conn.send((data, stream_info))
+                if not await asyncio.to_thread(worker.conn.poll, self.timeout):
+                    source = stream_info.url or stream_info.local_path
+                    raise TimeoutError(
+                        f"Converting {source} timed out after {self.timeout}s"
+                    )
+                ok, value = worker.conn.recv()
+            except EOFError:
+                worker.stop()
+                raise RuntimeError("Conversion worker exited unexpectedly") from None
+            except BaseException:
+                # A hung or interrupted worker may still answer later, so it is
+                # not reused
+                worker.stop()
+                raise
+            self._idle.append(worker)
+        if not ok:
+            raise value
+        return value
+
+    async def afetch(
+        self, source: str, cached: Optional[Dict[str, Any]] = None
+    ) -> FetchResult:
+        """
+        Fetch and convert a document. `cached` holds the validators and content hash
+        of a previous fetch (see FetchCache); unchanged documents are not converted.
+        """
+        return await _async_fetch(
+            source, self.max_bytes, self.timeout, self._async_convert, cached
+        )
+
+    async def aconvert(self, source: str) -> str:
+        return (await self.afetch(source)).text
+
+    def shutdown(self) -> None:
+        while self._idle:
+            self._idle.pop().stop()
 
 class MarkitDownReader(BaseReader):
+    def __init__(self, pool: Optional[ConversionPool] = None):
+        self.pool = pool
+
     def load_data(self, source: str) -> Document:
         md = MarkItDown()
         result = md.convert(source)
         doc = Document(text=result.text_content)
         doc.metadata["source"] = source
         return doc
+
+    async def aload_data(self, source: str) -> Document:
+        """Load a document without blocking the event loop"""
+        result = await self.afetch(source)
+        doc = Document(text=result.text)
+        doc.metadata["source"] = source
+        return doc
+
+    async def afetch(
+        self, source: str, cached: Optional[Dict[str, Any]] = None
+    ) -> FetchResult:
+        """Fetch a document, skipping conversion if it did not change since `cached`"""
+        if self.pool is None:
+            async def convert(data: bytes, stream_info: StreamInfo) -> str:
+                return await asyncio.to_thread(_convert, data, stream_info)
+            return await _async_fetch(
+                source, DEFAULT_MAX_BYTES, DEFAULT_TIMEOUT, convert, cached
+            )
+        return await self.pool.afetch(source, cached)
@@ -1,23 +1,28 @@
-from typing import Any, List, Dict, Optional
-import uuid
-import logging
-import datetime
 import asyncio
-from llama_index.core.schema import Document
-from llama_index.core.ingestion import IngestionCache, IngestionPipeline
+import base64
+import datetime
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit
+
 from llama_index.core import StorageContext
-from llama_index.core.extractors import (
-    KeywordExtractor,
-    SummaryExtractor,
-    TitleExtractor,
-)
-from llama_index.core.response_synthesizers import TreeSummarize
+from llama_index.core.schema import Document
 from llama_index.storage.kvstore.postgres import PostgresKVStore
-from llama_index.core.node_parser import SentenceSplitter
 
-from agents.reader import MarkitDownReader
-import agents.models as models
-from agents.keywords import KeywordsStore
+from agents.fetch_cache import FetchCache
+from agents.jobs import JobQueue
+from agents.keyword_index import KeywordIndex
+from agents.keyword_normalizer import KeywordNormalizer
+from agents.maintenance import async_delete_reference_nodes
+from agents.pipeline import IndexingPipeline
+from agents.reader import FetchResult, MarkitDownReader
+from agents.response_cache import (
+    async_clear_responses,
+    async_invalidate_responses,
+)
+
 
 class FetchError(Exception):
     def __init__(self, url: str, message: str):
@@ -28,10 +33,12 @@ class FetchError(Exception):
 class ReferenceStore:
     pg_pool: Any
     storage: StorageContext
-    ingest_pipeline: IngestionPipeline
+    indexing: IndexingPipeline
     logger: logging.Logger
     models: Any
     cache_store: PostgresKVStore
+    jobs: JobQueue
+    reader: MarkitDownReader
 
     def __init__(
         self,
@@ -39,40 +46,115 @@ class ReferenceStore:
         models: Any,
         cache_store: PostgresKVStore,
         storage: StorageContext,
-        ingest_pipeline: IngestionPipeline,
+        indexing: IndexingPipeline,
+        jobs: JobQueue,
         logger: logging.Logger,
+        reader: Optional[MarkitDownReader] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        keyword_normalizer: Optional[KeywordNormalizer] = None,
     ):
         self.pg = pg
         self.storage = storage
-        self.ingest_pipeline = ingest_pipeline
+        self.indexing = indexing
         self.models = models
         self.logger = logger
         self.cache_store = cache_store
+        self.jobs = jobs
+        self.reader = reader or MarkitDownReader()
+        self.fetch_cache = FetchCache(pg)
+        self.keyword_index = keyword_index
+        self.keyword_normalizer = keyword_normalizer or KeywordNormalizer(pg, logger)
         
-    async def async_list(self, include_contents: bool = False, keywords: List[str] | None = None) -> List[Dict[str, Any]]:
-        """List all references from the database"""
+    async def async_list(
+        self,
+        include_contents: bool = False,
+        keywords: List[str] | None = None,
+        include_keywords: bool = False,
+        limit: int | None = None,
+        cursor: str | None = None,
+        fields: List[str] | None = None,
+        any_keywords: List[str] | None = None,
+        exclude_keywords: List[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        List references from the database, newest first.
+
+        Pagination is keyset based on (created_at, id): pass the cursor of the last
+        reference of the previous page (see `encode_cursor`) to fetch the next page.
+        `fields` restricts the returned fields; `id` and `created_at` are always
+        included.
+
+        References can be filtered to those with all of `keywords`, at least one of
+        `any_keywords` and none of `exclude_keywords`. With a keyword index, the
+        filter and pagination are resolved in memory and only the rows of the
+        page are fetched.
+        """
         self.logger.info("Listing references")
+        if fields is not None:
+            invalid = set(fields) - set(LISTABLE_FIELDS)
+            if invalid:
+                names = ", ".join(sorted(invalid))
+                raise ValueError(f"Invalid reference fields: {names}")
+            include_contents = include_contents or "contents" in fields
+            include_keywords = include_keywords or "keywords" in fields
+
+        conditions = []
+        params: List[Any] = []
+        filtered = bool(keywords or any_keywords or exclude_keywords)
+        if filtered and self.keyword_index is not None:
+            await self.keyword_index.async_refresh()
+            matching = self.keyword_index.query(
+                keywords, any_keywords, exclude_keywords
+            )
+            after = decode_cursor(cursor) if cursor else None
+            ids = self.keyword_index.page(matching, limit, after)
+            if not ids:
+                return []
+            params.append(ids)
+            conditions.append(f"r.id = ANY(${len(params)}::uuid[])")
+            # The page is already cut
+            cursor = None
+            limit = None
+        else:
+            if keywords:
+                # Only keep references that have all of the requested keywords
+                params.append(keywords)
+                conditions.append(f'''r.id IN (
+                    SELECT rk.reference_id
+                    FROM references_keywords rk
+                    JOIN keywords k ON rk.keyword_id = k.id
+                    WHERE k.keyword = ANY(${len(params)})
+                    GROUP BY rk.reference_id
+                    HAVING COUNT(DISTINCT k.keyword) = array_length(${len(params)}, 1)
+                )''')
+            keyword_filters = ((any_keywords, "IN"), (exclude_keywords, "NOT IN"))
+            for values, operator in keyword_filters:
+                if values:
+                    params.append(values)
+                    conditions.append(f'''r.id {operator} (
+                        SELECT rk.reference_id
+                        FROM references_keywords rk
+                        JOIN keywords k ON rk.keyword_id = k.id
+                        WHERE k.keyword = ANY(${len(params)})
+                    )''')
+        if cursor:
+            params.extend(decode_cursor(cursor))
+            conditions.append(
+                f"(r.created_at, r.id) < "
+                f"(${len(params) - 1}::text::timestamptz, ${len(params)}::uuid)"
+            )
+
+        query = _select_references(include_contents, include_keywords, fields)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.created_at DESC, r.id DESC"
+        if limit is not None:
+            params.append(limit)
+            query += f" LIMIT ${len(params)}"
+
         try:
-            # Build SELECT clause based on whether contents is requested
-            select_fields = "id, type, source, title, summary, indexed, created_at"
-            if include_contents:
-                select_fields += ", contents"
-                
             async with self.pg.pool.acquire() as conn:
-                if keywords:
-                    # Join with reference_keywords table and filter by keywords
-                    result = await conn.fetch(f'''
-                        SELECT DISTINCT r.{select_fields}
-                        FROM "references" r
-                        INNER JOIN references_keywords rk ON r.id = rk.reference_id
-                        INNER JOIN keywords k ON rk.keyword_id = k.id
-                        WHERE k.keyword = ANY($1)
-                        GROUP BY r.id, r.{select_fields}
-                        HAVING COUNT(DISTINCT k.keyword) = array_length($1, 1)
-                        ORDER BY r.created_at DESC
-                    ''', keywords)
-                else:
-                    result = await conn.fetch(f'SELECT {select_fields} FROM "references" ORDER BY created_at DESC')
+                result = await conn.fetch(query, *params)
                 references = [self._normalize_reference(dict(row)) for row in result]
                 self.logger.info(f"Found {len(references)} references")
                 return references
@@ -81,6 +163,23 @@ class ReferenceStore:
             self.logger.exception(e)  # Log the full exception with traceback
             return []
         
+    async def async_export(
+        self, include_contents: bool = False, batch_size: int = 100
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream all references with their keywords, oldest first.
+
+        Rows are read through a server-side cursor in batches of `batch_size`, so
+        memory use does not depend on the size of the corpus.
+        """
+        select = _select_references(include_contents, include_keywords=True)
+        async with self.pg.pool.acquire() as conn:
+            # Server-side cursors only live inside a transaction
+            async with conn.transaction(readonly=True):
+                query = f'{select} ORDER BY r.created_at, r.id'
+                async for row in conn.cursor(query, prefetch=batch_size):
+                    yield self._normalize_reference(dict(row))
+
     async def async_add_url(self, url: str) -> Dict[str, Any]:
         """Add a URL reference to the database and process it"""
         self.logger.info(f"Adding URL reference: {url}")
@@ -90,26 +189,26 @@ class ReferenceStore:
             if reference:
                 self.logger.info(f"URL already exists: {url}")
                 if not reference["indexed"]:
-                    # If it exists but is not indexed, trigger background indexing
-                    asyncio.create_task(self._index_reference(reference))
+                    # If it exists but is not indexed, queue it for indexing
+                    await self.jobs.async_enqueue(reference["id"])
                 return reference
             
             # URL doesn't exist, fetch and create a new reference
             self.logger.info(f"URL does not exist: {url}")
-            reader = MarkitDownReader()
-            contents = reader.load_data(url)
+            fetched = await self.reader.afetch(url)
             reference_id = str(uuid.uuid4())
 
             # Insert unindexed reference into DB
             async with self.pg.pool.acquire() as conn:
                 result = await conn.fetchrow(
                     'INSERT INTO "references" (id, type, source, contents) VALUES ($1, $2, $3, $4) RETURNING *',
-                    reference_id, "url", url, contents.text
+                    reference_id, "url", url, fetched.text
                 )
                 reference = self._normalize_reference(dict(result))
+            await self.fetch_cache.async_put(url, fetched)
             
-            # Start indexing in the background
-            asyncio.create_task(self._index_reference(reference))
+            # Queue the reference for indexing by the worker pool
+            await self.jobs.async_enqueue(reference_id)
             
             # Return the unindexed reference immediately
             return reference
@@ -119,8 +218,93 @@ class ReferenceStore:
             self.logger.exception(e)
             raise
         
-    async def async_reindex_reference(self, reference_id: str) -> Dict[str, Any]:
-        """Reindex a reference by ID"""
+    async def async_add_urls(
+        self,
+        urls: List[str],
+        profile: str | None = None,
+        concurrency: int = 16,
+        per_host: int = 2,
+    ) -> List[Dict[str, Any]]:
+        """
+        Add many URL references at once.
+
+        URLs that already exist are looked up with a single query. New URLs are
+        fetched concurrently, with at most `concurrency` fetches in total and
+        `per_host` fetches per host, and inserted with one batched statement.
+        Returns one status entry per distinct URL, in input order.
+        """
+        urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+        self.logger.info(f"Adding {len(urls)} URL references")
+        results: Dict[str, Dict[str, Any]] = {}
+
+        existing = await self.async_get_references_by_urls(urls)
+        for url, reference in existing.items():
+            results[url] = {
+                "url": url, "status": "exists", "reference_id": reference["id"]
+            }
+        unindexed = [ref["id"] for ref in existing.values() if not ref["indexed"]]
+        await self.jobs.async_enqueue_many(unindexed, profile)
+
+        fetched = await self._fetch_urls(
+            [url for url in urls if url not in existing], concurrency, per_host
+        )
+        new_urls, contents, fetch_results = [], [], []
+        for url, result in fetched:
+            if isinstance(result, FetchError):
+                results[url] = {"url": url, "status": "error", "error": result.message}
+            else:
+                new_urls.append(url)
+                contents.append(result.text)
+                fetch_results.append((url, result))
+
+        if new_urls:
+            reference_ids = [str(uuid.uuid4()) for _ in new_urls]
+            async with self.pg.pool.acquire() as conn:
+                await conn.execute('''
+                    INSERT INTO "references" (id, type, source, contents)
+                    SELECT id, 'url', source, contents
+                    FROM unnest($1::uuid[], $2::text[], $3::text[])
+                        AS t(id, source, contents)
+                ''', reference_ids, new_urls, contents)
+            await self.fetch_cache.async_put_many(fetch_results)
+            await self.jobs.async_enqueue_many(reference_ids, profile)
+            for url, reference_id in zip(new_urls, reference_ids, strict=True):
+                results[url] = {
+                    "url": url, "status": "added", "reference_id": reference_id
+                }
+
+        return [results[url] for url in urls]
+
+    async def _fetch_urls(
+        self, urls: List[str], concurrency: int, per_host: int
+    ) -> List[tuple[str, FetchResult | FetchError]]:
+        """Fetch and convert URLs concurrently, bounded globally and per host"""
+        limit = asyncio.Semaphore(concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(per_host)
+        )
+
+        async def fetch(url: str) -> tuple[str, FetchResult | FetchError]:
+            async with host_limits[urlsplit(url).netloc], limit:
+                try:
+                    return url, await self.reader.afetch(url)
+                except Exception as e:
+                    self.logger.warning(f"Error fetching URL {url}: {str(e)}")
+                    return url, FetchError(url, str(e))
+
+        return list(await asyncio.gather(*(fetch(url) for url in urls)))
+
+    async def async_reindex_reference(
+        self, reference_id: str, force: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Reindex a reference by ID.
+
+        URL references are fetched with a conditional request based on the fetch
+        cache. If the document did not change and the reference is indexed, it is
+        returned as is without running the indexing pipeline, unless `force` is
+        set.
+        """
         self.logger.info(f"Reindexing reference: {reference_id}")
         try:
             reference = await self.async_get_reference(reference_id)
@@ -128,33 +312,39 @@ class ReferenceStore:
                 self.logger.error(f"Reference not found: {reference_id}")
                 raise ValueError(f"Reference not found: {reference_id}")
             
-            # Mark as unindexed first
-            async with self.pg.pool.acquire() as conn:
-                await conn.execute(
-                    'UPDATE "references" SET indexed = false WHERE id = $1',
-                    reference_id
+            contents = None
+            if reference["type"] == "url":
+                # Fetch the URL again, skipping conversion if it did not change
+                url = reference["source"]
+                cached = None if force else await self.fetch_cache.async_get(url)
+                fetched = await self.reader.afetch(url, cached)
+                await self.fetch_cache.async_put(url, fetched)
+
+                changed = (
+                    fetched.modified
+                    and fetched.markdown_hash != await self._contents_hash(reference_id)
                 )
-                
+                if changed:
+                    contents = fetched.text
+                elif reference["indexed"] and not force:
+                    self.logger.info(
+                        f"Reference unchanged, skipping reindex: {reference_id}"
+                    )
+                    return reference
+            
+            # Mark as unindexed and update the contents if they changed
+            async with self.pg.pool.acquire() as conn:
+                await conn.execute('''
+                    UPDATE "references"
+                    SET indexed = false, contents = COALESCE($2, contents)
+                    WHERE id = $1
+                ''', reference_id, contents)
+            
             # Get the updated reference
             reference = await self.async_get_reference(reference_id)
             
-            if reference["type"] == "url":
-                # Fetch and process the URL again
-                reader = MarkitDownReader()
-                contents = reader.load_data(reference["source"])
-                
-                # Update the contents in the database
-                async with self.pg.pool.acquire() as conn:
-                    await conn.execute(
-                        'UPDATE "references" SET contents = $2 WHERE id = $1',
-                        reference_id, contents.text
-                    )
-                
-                # Get the updated reference
-                reference = await self.async_get_reference(reference_id)
-            
-            # Start indexing in the background
-            asyncio.create_task(self._index_reference(reference))
+            # Queue the reference for indexing by the worker pool
+            await self.jobs.async_enqueue(reference_id)
             
             # Return the current reference immediately
             return reference
@@ -163,56 +353,60 @@ class ReferenceStore:
             self.logger.error(f"Error reindexing reference: {str(e)}")
             self.logger.exception(e)
             raise
+
+    async def _contents_hash(self, reference_id: str) -> Optional[str]:
+        """sha256 of the stored contents, computed in the database"""
+        async with self.pg.pool.acquire() as conn:
+            return await conn.fetchval('''
+                SELECT encode(sha256(convert_to(contents, 'UTF8')), 'hex')
+                FROM "references" WHERE id = $1
+            ''', reference_id)
         
-    async def _index_reference(self, reference: Dict[str, Any]) -> Dict[str, Any]:
+    async def async_index_reference(
+        self, reference_id: str, profile: str | None = None
+    ) -> Dict[str, Any]:
+        """
+        Index a reference by ID. Called by the indexing workers; errors are
+        propagated so the job can be retried.
+        """
+        reference = await self.async_get_reference(
+            reference_id, include_contents=True, include_keywords=False
+        )
+        if reference is None:
+            raise ValueError(f"Reference not found: {reference_id}")
+        return await self._index_reference(reference, profile)
+
+    async def _index_reference(
+        self, reference: Dict[str, Any], profile: str | None = None
+    ) -> Dict[str, Any]:
         """Index a reference"""
         try:
             self.logger.info(f"Starting indexing for reference: {reference['id']}")
             doc = Document(id_=str(reference["id"]), text=reference["contents"])
             reference_id = reference["id"]
             
-            nodes_transformations = [
-                SentenceSplitter(),
-                TitleExtractor(llm=self.models.simple, max_tokens=40),
-                SummaryExtractor(llm=self.models.simple, summaries=["self"], max_tokens=250),
-                KeywordExtractor(llm=self.models.simple, max_tokens=100),
-                models.openai_embeddings,
-            ]
-            nodes_pipeline = IngestionPipeline(
-                transformations=nodes_transformations,
-                cache=IngestionCache(cache=self.cache_store),
-                docstore=self.storage.docstore,
-                vector_store=self.storage.vector_store,
-            )
-            
-            # Process the document
-            nodes = await nodes_pipeline.arun(documents=[doc], show_progress=True)
+            # Process the document with the shared pipeline for the requested profile
+            nodes = await self.indexing.arun(doc, profile)
             self.logger.info(f"Nodes computed for reference: {reference_id}")
             
-            # Extract keywords from all nodes
-            keywords = set()
+            # Extract keywords from all nodes, then merge variants and keep the most
+            # specific ones
+            node_keywords = []
             for node in nodes:
                 if "excerpt_keywords" in node.metadata:
                     excerpt = node.metadata["excerpt_keywords"]
                     if excerpt.startswith("Keywords: "):
                         excerpt = excerpt[len("Keywords: "):]
-                    for keyword in excerpt.split(","):
-                        keyword = _normalize_keyword(keyword)
-                        if keyword:  # Skip empty keywords
-                            keywords.add(keyword)
+                    node_keywords.append(excerpt.split(","))
+            keywords = await self.keyword_normalizer.async_canonicalize(node_keywords)
 
             self.logger.info(f"Keywords extracted from reference {reference_id}: {keywords}")
 
-            tree_summarizer = TreeSummarize(llm=self.models.simple, use_async=True)
-            summary = await tree_summarizer.aget_response(
-                "Summarize the following text",
-                [doc.text],
-                max_tokens=250,
-            )
+            summary = await self.indexing.asummarize(reference["type"], doc, nodes)
             
             title = None
             if nodes:
-                title = nodes[0].metadata["document_title"]
+                title = nodes[0].metadata.get("document_title")
 
             async with self.pg.pool.acquire() as conn:
                 # Start a transaction
@@ -224,6 +418,9 @@ class ReferenceStore:
                         title,
                         summary,
                     )
+                    # Cached chat answers may quote the previous version or miss
+                    # the new contents
+                    await async_clear_responses(conn)
                     
                     # Store keywords
                     if keywords:
@@ -233,26 +430,26 @@ class ReferenceStore:
                             reference_id
                         )
                         
-                        # Insert or get keywords
-                        for keyword in keywords:
-                            # Get existing keyword or insert new one
-                            keyword_row = await conn.fetchrow(
-                                'INSERT INTO "keywords" (keyword) VALUES ($1) ON CONFLICT (keyword) DO NOTHING RETURNING id',
-                                keyword
-                            )
-                            
-                            # Get the keyword ID from the insert/get operation above
-                            keyword_id = keyword_row['id'] if keyword_row else await conn.fetchval(
-                                'SELECT id FROM keywords WHERE keyword = $1',
-                                keyword
-                            )
-                            
-                            # Associate keyword with reference
-                            await conn.execute(
-                                'INSERT INTO "references_keywords" (reference_id, keyword_id) VALUES ($1, $2) ON CONFLICT DO NOTHING',
-                                reference_id,
-                                keyword_id
+                        # Upsert all keywords and link them to the reference in a
+                        # single statement. DO UPDATE returns the id of existing
+                        # keywords too, including ones committed by a concurrent
+                        # indexing job after this statement started, which a
+                        # separate SELECT in the same statement could not see.
+                        # Keywords are upserted in sorted order so concurrent
+                        # indexing jobs lock them consistently.
+                        await conn.execute('''
+                            WITH keyword_ids AS (
+                                INSERT INTO keywords (keyword)
+                                SELECT DISTINCT unnest($2::text[]) AS keyword
+                                ORDER BY keyword
+                                ON CONFLICT (keyword)
+                                    DO UPDATE SET keyword = EXCLUDED.keyword
+                                RETURNING id
                             )
+                            INSERT INTO references_keywords (reference_id, keyword_id)
+                            SELECT $1::uuid, id FROM keyword_ids
+                            ON CONFLICT DO NOTHING
+                        ''', reference_id, list(keywords))
             
             self.logger.info(f"Successfully indexed reference: {reference_id}")
             
@@ -261,22 +458,33 @@ class ReferenceStore:
         except Exception as e:
             self.logger.error(f"Error during indexing of reference {reference['id']}: {str(e)}")
             self.logger.exception(e)
-            # Don't re-raise the exception since this is running in the background
-            return reference
+            raise
         
     async def async_delete_reference(self, reference_id: str) -> None:
         """Delete a reference by ID"""
-        self.logger.info(f"Deleting reference: {reference_id}")
-        try:
-            # Delete the entries from the index store first
-            await self.storage.vector_store.adelete_nodes(node_ids=[reference_id])
-            await self.storage.docstore.adelete_document(reference_id)
+        await self.async_delete_references([reference_id])
 
+    async def async_delete_references(self, reference_ids: List[str]) -> int:
+        """
+        Delete references by ID, together with all their chunks in the vector store
+        and their documents in the docstore, in a single transaction.
+        Returns the number of deleted references.
+        """
+        self.logger.info(f"Deleting references: {reference_ids}")
+        try:
             async with self.pg.pool.acquire() as conn:
-                # The references_keywords entries will be deleted automatically due to CASCADE
-                await conn.execute('DELETE FROM "references" WHERE id = $1', reference_id)
+                async with conn.transaction():
+                    await async_delete_reference_nodes(conn, reference_ids)
+                    await async_invalidate_responses(conn, reference_ids)
+                    # The references_keywords entries will be deleted automatically
+                    # due to CASCADE
+                    status = await conn.execute(
+                        'DELETE FROM "references" WHERE id = ANY($1::uuid[])',
+                        reference_ids,
+                    )
+                    return int(status.split()[-1])
         except Exception as e:
-            self.logger.error(f"Error deleting reference: {str(e)}")
+            self.logger.error(f"Error deleting references: {str(e)}")
             self.logger.exception(e)
             raise
         
@@ -286,30 +494,10 @@ class ReferenceStore:
     
     async def async_get_references(self, reference_ids: List[str], include_contents: bool = False, include_keywords: bool = False) -> List[Dict[str, Any]]:
         """Get references by IDs"""
-        keywords_store = KeywordsStore(self.pg)
+        select = _select_references(include_contents, include_keywords)
         async with self.pg.pool.acquire() as conn:
-            # Build the SELECT clause based on whether contents is requested
-            select_fields = "id, type, source, title, summary, indexed, created_at"
-            if include_contents:
-                select_fields += ", contents"
-                
-            results = await conn.fetch(f'''
-                SELECT {select_fields}
-                FROM "references" 
-                WHERE id = ANY($1)
-            ''', reference_ids)
-            references = []
-            
-            for result in results:
-                reference = self._normalize_reference(dict(result))
-                
-                # Get keywords for this reference if requested
-                if include_keywords:
-                    keywords = await keywords_store.async_get_reference_keywords(reference["id"])
-                    if keywords:
-                        reference["keywords"] = keywords
-                references.append(reference)
-            return references
+            results = await conn.fetch(f'{select} WHERE r.id = ANY($1)', reference_ids)
+            return [self._normalize_reference(dict(result)) for result in results]
 
     async def async_get_reference_contents(self, reference_id: str) -> Optional[str]:
         """Get the contents of a reference"""
@@ -320,38 +508,37 @@ class ReferenceStore:
 
     async def async_get_reference_by_url(self, url: str) -> Optional[Dict[str, Any]]:
         """Get a specific reference by URL"""
+        select = _select_references(include_contents=True, include_keywords=True)
         async with self.pg.pool.acquire() as conn:
-            result = await conn.fetchrow('SELECT * FROM "references" WHERE type = $1 AND source = $2 LIMIT 1', "url", url)
+            result = await conn.fetchrow(
+                f'{select} WHERE r.type = $1 AND r.source = $2 LIMIT 1', "url", url
+            )
             if result is None:
                 return None
-            reference = self._normalize_reference(dict(result))
-            
-            # Get keywords for this reference
-            keywords = await self._get_reference_keywords(reference["id"])
-            if keywords:
-                reference["keywords"] = keywords
-                
-            return reference
-    
-    async def _get_reference_keywords(self, reference_id: str) -> List[str]:
-        """Get keywords for a reference"""
-        async with self.pg.pool.acquire() as conn:
-            rows = await conn.fetch('''
-                SELECT k.keyword 
-                FROM keywords k
-                JOIN references_keywords rk ON k.id = rk.keyword_id
-                WHERE rk.reference_id = $1
-                ORDER BY k.keyword
-            ''', reference_id)
-            return [row['keyword'] for row in rows]
+            return self._normalize_reference(dict(result))
         
+    async def async_get_references_by_urls(
+        self, urls: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Get URL references by source, keyed by URL"""
+        async with self.pg.pool.acquire() as conn:
+            results = await conn.fetch('''
+                SELECT id, source, indexed FROM "references"
+                WHERE type = $1 AND source = ANY($2)
+            ''', "url", urls)
+            return {
+                row["source"]: self._normalize_reference(dict(row)) for row in results
+            }
+
     def _normalize_reference(self, reference: Dict[str, Any]) -> Dict[str, Any]:
-        """Normalize the reference data for JSON serialization"""
+        """
+        Normalize the reference data for JSON serialization. The dict is updated
+        in place, callers pass a fresh dict built from the database row.
+        """
         if not reference:
             return reference
         
-        # Create a copy to avoid modifying the original
-        result = dict(reference)
+        result = reference
             
         # Convert UUID to string
         if "id" in result and result["id"] is not None:
@@ -379,9 +566,61 @@ class ReferenceStore:
                 
         return result
     
-def _normalize_keyword(kw: str) -> str:
+REFERENCE_FIELDS = ["id", "type", "source", "title", "summary", "indexed", "created_at"]
+
+# Fields that can be requested with the `fields` projection of `async_list`
+LISTABLE_FIELDS = REFERENCE_FIELDS + ["contents", "keywords"]
+
+def encode_cursor(reference: Dict[str, Any]) -> str:
+    """Encode the keyset pagination cursor pointing after the given reference"""
+    value = f"{reference['created_at']}|{reference['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """
+    Decode a cursor of `encode_cursor`, raising ValueError if it does not hold a
+    timestamp and a reference ID
     """
-    Normalize a keyword for storage
-    keywords should be lowercase. Spaces and '-` symbols should be replaced with underscores.
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, reference_id = value.split("|")
+        # Checked here, so the query does not fail on them
+        datetime.datetime.fromisoformat(created_at)
+        uuid.UUID(reference_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+    return created_at, reference_id
+
+def _select_references(
+    include_contents: bool = False,
+    include_keywords: bool = False,
+    projection: List[str] | None = None,
+) -> str:
     """
-    return kw.strip().lower().replace(" ", "_").replace("-", "_")
\ No newline at end of file
+    Build the SELECT ... FROM clause for querying references aliased as `r`.
+    Keywords are aggregated in the same query, so listing references costs a
+    single round trip no matter how many rows are returned.
+    """
+    columns = REFERENCE_FIELDS
+    if projection is not None:
+        columns = ["id", "created_at"] + [
+            field for field in REFERENCE_FIELDS
+            if field in projection and field not in ("id", "created_at")
+        ]
+    fields = [f"r.{field}" for field in columns]
+    if include_contents:
+        fields.append("r.contents")
+    if not include_keywords:
+        return f'SELECT {", ".join(fields)} FROM "references" r'
+
+    fields.append("COALESCE(kw.keywords, '{}') AS keywords")
+    return f'''
+        SELECT {", ".join(fields)}
+        FROM "references" r
+        LEFT JOIN LATERAL (
+            SELECT array_agg(k.keyword ORDER BY k.keyword) AS keywords
+            FROM references_keywords rk
+            JOIN keywords k ON k.id = rk.keyword_id
+            WHERE rk.reference_id = r.id
+        ) kw ON true
+    '''
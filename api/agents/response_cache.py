@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import uuid
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from agents.prompt import Message
+
+
+async def async_invalidate_responses(conn: Any, reference_ids: List[str]) -> None:
+    """
+    Drop cached chat responses that used any of the given references as context.
+    Runs on the given connection, so callers can invalidate in the transaction
+    that changes the references.
+    """
+    await conn.execute(
+        'DELETE FROM chat_cache WHERE reference_ids && $1::uuid[]',
+        reference_ids,
+    )
+
+async def async_clear_responses(conn: Any) -> None:
+    """
+    Drop all cached chat responses. A newly indexed document may answer any
+    cached query better, so indexing clears the whole cache.
+    """
+    await conn.execute('DELETE FROM chat_cache')
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def _normalize_embedding(embedding: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+    return [x / norm for x in embedding]
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+class CachedQuery:
+    """A chat query looked up in the response cache"""
+
+    def __init__(
+        self,
+        context_hash: str,
+        query: str,
+        embedding: List[float],
+        response: Optional[str] = None,
+    ):
+        self.context_hash = context_hash
+        self.query = query
+        self.embedding = embedding
+        self.response = response
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+class ResponseCache:
+    """
+    Semantic cache of chat responses.
+
+    Responses are keyed by a hash of the conversation context (history, model and
+    retrieval settings) and by the normalized embedding of the query. The query is
+    embedded as sent, so a miss can hand the embedding on to retrieval. A lookup
+    hits if a non-expired response with the same context has a query embedding
+    within `threshold` cosine similarity. All entries are dropped when a reference
+    is indexed, and the entries that used a reference as context when it is
+    deleted.
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        embed_model: BaseEmbedding,
+        logger: logging.Logger,
+        threshold: float = 0.95,
+        ttl: float = 86400,
+    ):
+        self.pg = pg
+        self.embed_model = embed_model
+        self.logger = logger
+        self.threshold = threshold
+        self.ttl = ttl
+
+    @staticmethod
+    def context_hash(history: Sequence[Message], model: str, **params: Any) -> str:
+        context = {
+            "history": [[m.role, m.content_str()] for m in history],
+            "model": model,
+            "params": params,
+        }
+        data = json.dumps(context, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def async_lookup(self, query: str, context_hash: str) -> CachedQuery:
+        embedding = await self.embed_model.aget_query_embedding(query)
+        embedding = _normalize_embedding(embedding)
+        query = _normalize_query(query)
+        async with self.pg.pool.acquire() as conn:
+            response = await conn.fetchval('''
+                SELECT response FROM chat_cache
+                WHERE context_hash = $1
+                  AND expires_at > now()
+                  AND 1 - (embedding <=> $2::text::vector) >= $3
+                ORDER BY embedding <=> $2::text::vector
+                LIMIT 1
+            ''', context_hash, json.dumps(embedding), self.threshold)
+        if response is not None:
+            self.logger.info(f"Chat cache hit for query: {query}")
+        return CachedQuery(context_hash, query, embedding, response)
+
+    async def async_store(
+        self, cached: CachedQuery, response: str, reference_ids: List[str]
+    ) -> None:
+        # Only references can be invalidated, other documents use non-UUID IDs
+        reference_ids = [
+            id for id in dict.fromkeys(reference_ids) if id and _is_uuid(id)
+        ]
+        async with self.pg.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO chat_cache (
+                    context_hash, query, embedding, response, reference_ids,
+                    expires_at
+                )
+                VALUES (
+                    $1, $2, $3::text::vector, $4, $5::uuid[],
+                    now() + make_interval(secs => $6)
+                )
+            ''', cached.context_hash, cached.query, json.dumps(cached.embedding),
+                response, reference_ids, self.ttl)
+
+    async def replay(
+        self, cached: CachedQuery, chunk_size: int = 64
+    ) -> AsyncIterator[str]:
+        """Stream a cached response in chunks, like a live response"""
+        for i in range(0, len(cached.response), chunk_size):
+            yield cached.response[i:i + chunk_size]
+
+    async def record(
+        self,
+        cached: CachedQuery,
+        stream: AsyncIterator[str],
+        reference_ids: List[str],
+    ) -> AsyncIterator[str]:
+        """Pass a live response stream through and cache it once it completes"""
+        parts = []
+        async for part in stream:
+            parts.append(part)
+            yield part
+        try:
+            await self.async_store(cached, "".join(parts), reference_ids)
+        except Exception as e:
+            self.logger.error(f"Failed to cache chat response: {str(e)}")
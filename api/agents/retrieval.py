@@ -0,0 +1,227 @@
+import json
+import re
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from pydantic import BaseModel, Field
+from sqlalchemy import Engine
+
+import env
+from agents.maintenance import STORE_SCHEMA, TEXT_SEARCH_CONFIG, VECTORS_TABLE
+
+
+class RetrievalOptions(BaseModel):
+    """Retrieval settings for chat, defaults come from env.py"""
+    mode: Literal["dense", "hybrid"] = env.CHAT_RETRIEVAL_MODE
+    top_k: int = Field(default=env.CHAT_TOP_K, ge=1, le=50)
+    # Weights of the dense (vector) and sparse (full-text) rankings in the fusion,
+    # only used in hybrid mode
+    dense_weight: float = Field(default=env.CHAT_DENSE_WEIGHT, ge=0)
+    sparse_weight: float = Field(default=env.CHAT_SPARSE_WEIGHT, ge=0)
+
+class EmptyRetriever(BaseRetriever):
+    """Retriever for an empty retrieval scope, e.g. keywords without references"""
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return []
+
+def _nodes(rows: List[Any]) -> List[NodeWithScore]:
+    results = []
+    for row in rows:
+        metadata = row["metadata_"]
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        node = metadata_dict_to_node(metadata)
+        node.set_content(row["text"])
+        results.append(NodeWithScore(node=node, score=float(row["score"])))
+    return results
+
+async def _async_fetch(
+    pg: Any, query_settings: Dict[str, str], query: str, *args: Any
+) -> List[Any]:
+    """Run a retrieval query with the vector index settings set for its transaction"""
+    async with pg.pool.acquire() as conn, conn.transaction(readonly=True):
+        for name, value in query_settings.items():
+            await conn.execute(f"SET LOCAL {name} = {int(value)}")
+        return await conn.fetch(query, *args)
+
+def _fetch(
+    engine: Optional[Engine], query_settings: Dict[str, str], query: str, *args: Any
+) -> List[Any]:
+    """
+    Run a retrieval query on the sync store engine, for retrievers used outside
+    the event loop
+    """
+    if engine is None:
+        raise NotImplementedError("Synchronous retrieval needs the sync store engine")
+    # asyncpg placeholders ($1) to psycopg2 ones (%(p1)s)
+    query = re.sub(r"\$(\d+)", r"%(p\1)s", query.replace("%", "%%"))
+    with engine.begin() as conn:
+        for name, value in query_settings.items():
+            conn.exec_driver_sql(f"SET LOCAL {name} = {int(value)}")
+        params = {f"p{i}": arg for i, arg in enumerate(args, 1)}
+        result = conn.exec_driver_sql(query, params)
+        return list(result.mappings())
+
+class ScopedDenseRetriever(BaseRetriever):
+    """
+    Vector similarity retrieval restricted to the chunks of `reference_ids`.
+
+    The IDs are bound as a query parameter. The pgvector store renders IN filters
+    into the SQL text, so scoped dense retrieval does not go through it.
+    Synchronous retrieval runs on `engine`, the sync store engine.
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        embed_model: BaseEmbedding,
+        reference_ids: List[str],
+        top_k: int = 5,
+        query_settings: Optional[Dict[str, str]] = None,
+        engine: Optional[Engine] = None,
+        **kwargs: Any,
+    ):
+        self.pg = pg
+        self.embed_model = embed_model
+        self.reference_ids = reference_ids
+        self.top_k = top_k
+        self.query_settings = query_settings or {}
+        self.engine = engine
+        super().__init__(**kwargs)
+
+    def _query(self, embedding: List[float]) -> Tuple[str, List[Any]]:
+        table = f'{STORE_SCHEMA}."data_{VECTORS_TABLE}"'
+        return f'''
+            SELECT node_id, text, metadata_,
+                   1 - (embedding <=> $1::text::vector) AS score
+            FROM {table}
+            WHERE metadata_->>'ref_doc_id' = ANY($2::text[])
+            ORDER BY embedding <=> $1::text::vector
+            LIMIT $3
+        ''', [json.dumps(embedding), self.reference_ids, self.top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        query, args = self._query(embedding)
+        return _nodes(_fetch(self.engine, self.query_settings, query, *args))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(
+                query_bundle.query_str
+            )
+        query, args = self._query(embedding)
+        return _nodes(await _async_fetch(self.pg, self.query_settings, query, *args))
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves chunks by combining pgvector similarity with Postgres full-text search
+    on the chunk text.
+
+    Both rankings and their reciprocal rank fusion are computed in a single SQL
+    statement, so a retrieval costs one round trip. Requires the `text_search_tsv`
+    column on the vectors table, see `manage.py text-search-index`.
+
+    With `reference_ids`, only chunks of those references are ranked.
+    `query_settings` (e.g. `hnsw.ef_search`, see VectorIndexConfig) are set for
+    the statement's transaction, since it runs on the asyncpg pool. Synchronous
+    retrieval runs the same statement on `engine`, the sync store engine.
+    """
+
+    def __init__(
+        self,
+        pg: Any,
+        embed_model: BaseEmbedding,
+        top_k: int = 5,
+        dense_weight: float = 1.0,
+        sparse_weight: float = 1.0,
+        rrf_k: int = 60,
+        text_search_config: str = TEXT_SEARCH_CONFIG,
+        reference_ids: Optional[List[str]] = None,
+        query_settings: Optional[Dict[str, str]] = None,
+        engine: Optional[Engine] = None,
+        **kwargs: Any,
+    ):
+        self.pg = pg
+        self.embed_model = embed_model
+        self.top_k = top_k
+        # Number of candidates taken from each ranking before fusion
+        self.candidates = max(top_k * 4, 20)
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.rrf_k = rrf_k
+        self.text_search_config = text_search_config
+        self.reference_ids = reference_ids
+        self.query_settings = query_settings or {}
+        self.engine = engine
+        super().__init__(**kwargs)
+
+    def _query(self, query_str: str, embedding: List[float]) -> Tuple[str, List[Any]]:
+        table = f'{STORE_SCHEMA}."data_{VECTORS_TABLE}"'
+        return f'''
+            WITH dense AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS rank
+                FROM (
+                    SELECT id, embedding <=> $1::text::vector AS distance FROM {table}
+                    WHERE $9::text[] IS NULL
+                       OR metadata_->>'ref_doc_id' = ANY($9::text[])
+                    ORDER BY distance
+                    LIMIT $3
+                ) d
+            ),
+            sparse AS (
+                SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+                FROM (
+                    SELECT v.id, ts_rank_cd(v.text_search_tsv, query) AS text_rank
+                    FROM {table} v, websearch_to_tsquery($8::regconfig, $2) query
+                    WHERE v.text_search_tsv @@ query
+                      AND ($9::text[] IS NULL
+                           OR v.metadata_->>'ref_doc_id' = ANY($9::text[]))
+                    ORDER BY text_rank DESC
+                    LIMIT $3
+                ) s
+            ),
+            fused AS (
+                SELECT COALESCE(d.id, s.id) AS id,
+                       COALESCE($4::float8 / ($6::float8 + d.rank), 0)
+                         + COALESCE($5::float8 / ($6::float8 + s.rank), 0) AS score
+                FROM dense d FULL OUTER JOIN sparse s ON d.id = s.id
+            )
+            SELECT v.node_id, v.text, v.metadata_, f.score
+            FROM fused f JOIN {table} v ON v.id = f.id
+            ORDER BY f.score DESC
+            LIMIT $7
+        ''', [
+            json.dumps(embedding),
+            query_str,
+            self.candidates,
+            self.dense_weight,
+            self.sparse_weight,
+            self.rrf_k,
+            self.top_k,
+            self.text_search_config,
+            self.reference_ids,
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        query, args = self._query(query_bundle.query_str, embedding)
+        return _nodes(_fetch(self.engine, self.query_settings, query, *args))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(
+                query_bundle.query_str
+            )
+        query, args = self._query(query_bundle.query_str, embedding)
+        return _nodes(await _async_fetch(self.pg, self.query_settings, query, *args))
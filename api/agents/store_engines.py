@@ -0,0 +1,151 @@
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from llama_index.storage.kvstore.postgres import PostgresKVStore
+from llama_index.storage.kvstore.postgres.base import params_from_uri
+from sqlalchemy import URL, create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+
+def connection_settings_listener(
+    settings: Dict[str, str]
+) -> Callable[[Any, Any], None]:
+    """
+    SQLAlchemy `connect` listener that sets the given integer settings on each new
+    connection
+    """
+    def apply(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"SET {name} = {int(value)}")
+        cursor.close()
+        # Commit so a later rollback of the first transaction does not undo the
+        # settings
+        dbapi_connection.commit()
+    return apply
+
+class StoreEngines:
+    """
+    SQLAlchemy engines shared by the llama_index Postgres stores.
+
+    The docstore, index store, ingestion cache and vector stores each create a
+    sync and an async engine with their own pools by default. Sharing one pair
+    of bounded pools (no overflow) caps the connections of all stores at
+    `sync_pool_size + async_pool_size`.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        sync_pool_size: int = 2,
+        async_pool_size: int = 4,
+        pool_timeout: float = 30,
+        connect_settings: Optional[Dict[str, str]] = None,
+    ):
+        params = params_from_uri(database_url)
+        url_params = dict(
+            username=params["user"],
+            password=params["password"],
+            host=params["host"],
+            port=params["port"],
+            database=params["database"],
+        )
+        self.url = URL.create("postgresql+psycopg2", **url_params)
+        self.async_url = URL.create("postgresql+asyncpg", **url_params)
+        self.sync_pool_size = sync_pool_size
+        self.async_pool_size = async_pool_size
+
+        self.engine = create_engine(
+            self.url,
+            pool_size=sync_pool_size,
+            max_overflow=0,
+            pool_timeout=pool_timeout,
+        )
+        self.async_engine = create_async_engine(
+            self.async_url,
+            pool_size=async_pool_size,
+            max_overflow=0,
+            pool_timeout=pool_timeout,
+        )
+        if connect_settings:
+            listener = connection_settings_listener(connect_settings)
+            event.listen(self.engine, "connect", listener)
+            event.listen(self.async_engine.sync_engine, "connect", listener)
+        self.session = sessionmaker(self.engine)
+        self.async_session = sessionmaker(self.async_engine, class_=AsyncSession)
+
+    @classmethod
+    def from_budget(
+        cls,
+        database_url: str,
+        budget: int,
+        reserved: int,
+        logger: logging.Logger,
+        **kwargs: Any,
+    ) -> "StoreEngines":
+        """
+        Size the store pools to the connections left of the process budget after
+        `reserved` connections (the asyncpg pool and listeners). A third goes to
+        the sync engine, the rest to the async engine used by chat retrieval and
+        indexing.
+        """
+        available = budget - reserved
+        if available < 2:
+            raise ValueError(
+                f"Connection budget of {budget} leaves {available} connections "
+                f"for the stores after {reserved} reserved, at least 2 are needed"
+            )
+        sync_pool_size = max(1, available // 3)
+        async_pool_size = available - sync_pool_size
+        logger.info(
+            f"Connection budget {budget}: {reserved} reserved, store pools "
+            f"{sync_pool_size} sync and {async_pool_size} async"
+        )
+        return cls(
+            database_url,
+            sync_pool_size=sync_pool_size,
+            async_pool_size=async_pool_size,
+            **kwargs,
+        )
+
+    def size(self) -> int:
+        """Open connections of both store pools"""
+        total = 0
+        for pool in (self.engine.pool, self.async_engine.sync_engine.pool):
+            total += pool.checkedin() + pool.checkedout()
+        return total
+
+    def bind(self, store: Any) -> None:
+        """Point a store at the shared engines instead of its own"""
+        store._engine = self.engine
+        store._session = self.session
+        store._async_engine = self.async_engine
+        store._async_session = self.async_session
+
+    async def async_dispose(self) -> None:
+        self.engine.dispose()
+        await self.async_engine.dispose()
+
+class SharedPostgresKVStore(PostgresKVStore):
+    """PostgresKVStore on shared engines, see StoreEngines"""
+
+    def __init__(
+        self,
+        engines: StoreEngines,
+        table_name: str,
+        schema_name: str = "public",
+        **kwargs: Any,
+    ):
+        async_url = engines.async_url.render_as_string(hide_password=False)
+        super().__init__(
+            connection_string=engines.url.render_as_string(hide_password=False),
+            async_connection_string=async_url,
+            table_name=table_name,
+            schema_name=schema_name,
+            **kwargs,
+        )
+        self.engines = engines
+
+    def _connect(self) -> Any:
+        self.engines.bind(self)
@@ -0,0 +1,101 @@
+import asyncio
+from typing import Dict, List, Literal, Optional, Sequence
+
+from llama_index.core.llms import LLM
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.response_synthesizers import TreeSummarize
+from llama_index.core.schema import BaseNode, Document
+
+SummaryStrategy = Literal["nodes", "full_text"]
+
+# Summary strategy overrides per reference type, e.g. {"url": "full_text"}.
+# Types not listed use the default strategy (SUMMARY_STRATEGY).
+SUMMARY_STRATEGIES: Dict[str, SummaryStrategy] = {}
+
+COMBINE_SUMMARIES_PROMPT = PromptTemplate(
+    "The following are summaries of consecutive sections of a single document.\n"
+    "---------------------\n"
+    "{summaries}\n"
+    "---------------------\n"
+    "Combine them into one concise summary of the whole document.\n"
+    "Summary: "
+)
+
+class ReferenceSummarizer:
+    """
+    Computes the reference-level summary after the node pipeline has run.
+
+    Strategies:
+    - `nodes`: map-reduce over the per-node `section_summary` metadata produced by
+      the SummaryExtractor. Summaries are combined in groups of at most `fan_out`
+      until a single summary remains, so the document text is not sent to the LLM
+      a second time.
+    - `full_text`: run TreeSummarize over the full document text.
+
+    The `nodes` strategy falls back to `full_text` if the nodes carry no section
+    summaries, e.g. when the summary extractor is disabled.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        fan_out: int = 8,
+        max_concurrency: int = 4,
+        default_strategy: SummaryStrategy = "nodes",
+        strategies: Optional[Dict[str, SummaryStrategy]] = None,
+    ):
+        if fan_out < 2:
+            raise ValueError("fan_out must be at least 2")
+        self.llm = llm
+        self.fan_out = fan_out
+        self.max_concurrency = max_concurrency
+        self.default_strategy = default_strategy
+        self.strategies = SUMMARY_STRATEGIES if strategies is None else strategies
+
+    def strategy(self, reference_type: str) -> SummaryStrategy:
+        return self.strategies.get(reference_type, self.default_strategy)
+
+    async def asummarize(
+        self,
+        reference_type: str,
+        doc: Document,
+        nodes: Sequence[BaseNode],
+    ) -> str:
+        if self.strategy(reference_type) == "nodes":
+            summaries = [
+                node.metadata["section_summary"]
+                for node in nodes
+                if node.metadata.get("section_summary")
+            ]
+            if summaries:
+                return await self._reduce(summaries)
+        return await self._summarize_full_text(doc)
+
+    async def _summarize_full_text(self, doc: Document) -> str:
+        tree_summarizer = TreeSummarize(llm=self.llm, use_async=True)
+        return await tree_summarizer.aget_response(
+            "Summarize the following text",
+            [doc.text],
+            max_tokens=250,
+        )
+
+    async def _reduce(self, summaries: List[str]) -> str:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def combine(group: List[str]) -> str:
+            if len(group) == 1:
+                return group[0]
+            async with semaphore:
+                return await self.llm.apredict(
+                    COMBINE_SUMMARIES_PROMPT,
+                    summaries="\n\n".join(group),
+                )
+
+        while len(summaries) > 1:
+            groups = [
+                summaries[i:i + self.fan_out]
+                for i in range(0, len(summaries), self.fan_out)
+            ]
+            combined = await asyncio.gather(*(combine(group) for group in groups))
+            summaries = list(combined)
+        return summaries[0].strip()
@@ -1,4 +1,3 @@
-from typing import Any, List
 
 from llama_index.core.extractors import (
     KeywordExtractor,
@@ -7,11 +6,8 @@ from llama_index.core.extractors import (
 )
 from llama_index.core.ingestion import IngestionCache, IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.schema import Document
-from llama_index.core.tools.tool_spec.base import BaseToolSpec
 
 # if __name__ == "__main__":
-from llama_index.readers.wikipedia import WikipediaReader
 from llama_index.storage.kvstore.postgres import PostgresKVStore
 from llama_index.storage.kvstore.postgres.base import params_from_uri
 from llama_index.vector_stores.postgres import PGVectorStore
@@ -23,7 +19,7 @@ from agents.wiki import WikipediaToolSpec
 PostgresCacheStore = PostgresKVStore
 
 
-from llama_index.core import DocumentSummaryIndex, StorageContext, VectorStoreIndex
+from llama_index.core import StorageContext, VectorStoreIndex
 from llama_index.storage.docstore.postgres import PostgresDocumentStore
 from llama_index.storage.index_store.postgres import PostgresIndexStore
 
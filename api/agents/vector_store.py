@@ -0,0 +1,97 @@
+from typing import Any, Dict, Literal, Optional
+
+from llama_index.vector_stores.postgres import PGVectorStore
+from pydantic import BaseModel, PrivateAttr
+from sqlalchemy import event
+
+import env
+from agents.store_engines import StoreEngines, connection_settings_listener
+
+VectorIndexType = Literal["hnsw", "ivfflat", "none"]
+
+class VectorIndexConfig(BaseModel):
+    """
+    Approximate nearest neighbour index on the vector store embeddings.
+
+    `m`, `ef_construction` and `lists` are build parameters used by
+    `manage.py vector-index`. `ef_search` and `probes` are applied to every
+    connection of the vector store at query time.
+    """
+    type: VectorIndexType = "hnsw"
+    # HNSW
+    m: int = 16
+    ef_construction: int = 64
+    ef_search: int = 40
+    # IVFFlat
+    lists: int = 100
+    probes: int = 1
+
+    def query_settings(self) -> Dict[str, str]:
+        if self.type == "hnsw":
+            return {"hnsw.ef_search": str(self.ef_search)}
+        if self.type == "ivfflat":
+            return {"ivfflat.probes": str(self.probes)}
+        return {}
+
+    def index_method(self) -> Optional[str]:
+        """
+        USING and WITH clause of the CREATE INDEX statement, None if no index is
+        configured
+        """
+        if self.type == "hnsw":
+            return (
+                f"hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {self.m}, ef_construction = {self.ef_construction})"
+            )
+        if self.type == "ivfflat":
+            return f"ivfflat (embedding vector_cosine_ops) WITH (lists = {self.lists})"
+        return None
+
+    @classmethod
+    def from_env(cls) -> "VectorIndexConfig":
+        return cls(
+            type=env.VECTOR_INDEX_TYPE,
+            m=env.VECTOR_HNSW_M,
+            ef_construction=env.VECTOR_HNSW_EF_CONSTRUCTION,
+            ef_search=env.VECTOR_HNSW_EF_SEARCH,
+            lists=env.VECTOR_IVFFLAT_LISTS,
+            probes=env.VECTOR_IVFFLAT_PROBES,
+        )
+
+class TunedPGVectorStore(PGVectorStore):
+    """
+    PGVectorStore that applies the ANN query settings to each new connection.
+    With `engines`, it runs on the shared store engines, which apply the settings.
+    """
+
+    _query_settings: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _engines: Optional[StoreEngines] = PrivateAttr(default=None)
+
+    @classmethod
+    def from_params(
+        cls,
+        *args: Any,
+        index_config: Optional[VectorIndexConfig] = None,
+        engines: Optional[StoreEngines] = None,
+        **kwargs: Any,
+    ) -> "TunedPGVectorStore":
+        store = super().from_params(*args, **kwargs)
+        if index_config is not None:
+            store._query_settings = index_config.query_settings()
+        store._engines = engines
+        return store
+
+    def _connect(self) -> Any:
+        if self._engines is not None:
+            self._engines.bind(self)
+            return
+        super()._connect()
+        if self._query_settings:
+            apply = connection_settings_listener(self._query_settings)
+            event.listen(self._engine, "connect", apply)
+            event.listen(self._async_engine.sync_engine, "connect", apply)
+
+    async def close(self) -> None:
+        # Shared engines are disposed by their owner
+        if self._engines is None:
+            await super().close()
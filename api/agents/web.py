@@ -1,2 +0,0 @@
-from llama_index.tools.duckduckgo import DuckDuckGoSearchToolSpec
-from llama_index.readers.web import SpiderReader
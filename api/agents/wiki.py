@@ -1,8 +1,7 @@
 from typing import Any
+
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.schema import Document
-
-
 from llama_index.core.tools.tool_spec.base import BaseToolSpec
 
 
@@ -0,0 +1,97 @@
+"""
+Benchmark the per-request setup of the chat engine.
+
+Compares building a chat engine per request with `index.as_chat_engine()` (the
+previous implementation) with the shared engine registry, which only creates
+a per-request memory around prebuilt components. Measures time and allocated
+memory of the setup alone; no LLM or database calls are made.
+
+Needs POSTGRES_URL and OPENAI_API_KEY to be set so the stores and models can be
+constructed. Run from the api directory:
+
+    python -m benchmarks.chat_setup --requests 1000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import tracemalloc
+
+from llama_index.core.llms import ChatMessage
+
+import env
+from agents import AI
+from main import Postgres
+
+
+def history(turns: int) -> list[ChatMessage]:
+    messages = []
+    for i in range(turns):
+        question = f"Question {i} about the references?"
+        answer = f"Answer {i} quoting a reference. " * 10
+        messages.append(ChatMessage(role="user", content=question))
+        messages.append(ChatMessage(role="assistant", content=answer))
+    return messages
+
+def timed(fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+def allocated(fn, runs: int) -> float:
+    """Average peak of bytes allocated per call"""
+    tracemalloc.start()
+    total = 0
+    for _ in range(runs):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / runs
+
+def report(name: str, timings: list[float], size: float) -> None:
+    p99 = sorted(timings)[int(len(timings) * 0.99) - 1]
+    print(f"{name:<40} median {statistics.median(timings):9.1f} us   "
+          f"p99 {p99:9.1f} us   {size / 1024:8.1f} KiB")
+
+def run(args: argparse.Namespace) -> None:
+    ai = AI(Postgres(env.POSTGRES_URL), logging.getLogger("bench"))
+    try:
+        chat_history = history(args.turns)
+        llm = ai.models.get_llm(None)
+
+        def per_request():
+            engine = ai.index.as_chat_engine(llm=llm)
+            # astream_chat(chat_history=...) loaded the history into the engine memory
+            engine.memory.set(chat_history)
+            return engine
+
+        def registry():
+            return ai.get_llm(chat_history=chat_history)
+
+        # Warm up imports and lazily built state of both paths
+        per_request()
+        registry()
+
+        print(f"{args.requests} chat setups, {args.turns} turns of history\n")
+        for name, fn in [
+            ("as_chat_engine per request", per_request),
+            ("engine registry", registry),
+        ]:
+            report(name, timed(fn, args.requests), allocated(fn, args.requests))
+    finally:
+        ai.shutdown()
+        asyncio.run(ai.store_engines.async_dispose())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=10)
+    run(parser.parse_args())
@@ -0,0 +1,137 @@
+"""
+Benchmark keyword facet counts.
+
+Compares the previous GROUP BY queries over `keywords JOIN references_keywords`
+with the materialized `keyword_counts` table (no selection) and the in-memory
+keyword index (selected tags).
+
+The benchmark seeds a throwaway schema in the database at POSTGRES_URL and drops
+it afterwards. Run from the api directory:
+
+    python -m benchmarks.keyword_counts --references 100000
+"""
+import argparse
+import asyncio
+import logging
+import uuid
+
+import asyncpg
+
+import env
+from agents.keywords import KeywordsStore
+from benchmarks.references_list import (
+    SCHEMA_SQL,
+    SEED_KEYWORDS_SQL,
+    SEED_REFERENCES_KEYWORDS_SQL,
+    SEED_REFERENCES_SQL,
+    BenchPostgres,
+    report,
+    timed,
+)
+from main import init_connection
+
+COUNTS_SQL = '''
+    CREATE TABLE keyword_counts (
+        keyword_id integer PRIMARY KEY,
+        count integer DEFAULT 0
+    );
+    INSERT INTO keyword_counts (keyword_id, count)
+    SELECT keyword_id, count(*) FROM references_keywords GROUP BY keyword_id;
+'''
+
+async def counts_group_by(pg: BenchPostgres, selected: list[str]) -> dict[str, int]:
+    """The previous implementation"""
+    async with pg.pool.acquire() as conn:
+        if selected:
+            result = await conn.fetch('''
+                WITH filtered_refs AS (
+                    SELECT r.id
+                    FROM "references" r
+                    JOIN references_keywords rk ON r.id = rk.reference_id
+                    JOIN keywords k ON rk.keyword_id = k.id
+                    WHERE k.keyword = ANY($1)
+                    GROUP BY r.id
+                    HAVING COUNT(DISTINCT k.keyword) = $2
+                )
+                SELECT k.keyword, COUNT(DISTINCT rk.reference_id) as count
+                FROM keywords k
+                JOIN references_keywords rk ON k.id = rk.keyword_id
+                JOIN filtered_refs fr ON rk.reference_id = fr.id
+                GROUP BY k.keyword
+                ORDER BY count DESC
+            ''', selected, len(selected))
+        else:
+            result = await conn.fetch('''
+                SELECT k.keyword, COUNT(rk.reference_id) as count
+                FROM keywords k
+                JOIN references_keywords rk ON k.id = rk.keyword_id
+                GROUP BY k.keyword
+                ORDER BY count DESC
+            ''')
+        return {row['keyword']: row['count'] for row in result}
+
+async def run(args: argparse.Namespace) -> None:
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = await asyncpg.connect(env.POSTGRES_URL)
+    await admin.execute(f'CREATE SCHEMA {schema}')
+    try:
+        pool = await asyncpg.create_pool(
+            env.POSTGRES_URL,
+            init=init_connection,
+            min_size=2,
+            max_size=10,
+            server_settings={"search_path": schema},
+        )
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(SCHEMA_SQL)
+                await conn.execute(SEED_KEYWORDS_SQL, args.keywords)
+                await conn.execute(SEED_REFERENCES_SQL, args.references)
+                await conn.execute(
+                    SEED_REFERENCES_KEYWORDS_SQL,
+                    args.keywords,
+                    args.keywords_per_reference,
+                )
+                await conn.execute(COUNTS_SQL)
+                await conn.execute('ANALYZE')
+                # The most used keywords, so the selection matches references
+                selected = [row["keyword"] for row in await conn.fetch('''
+                    SELECT k.keyword
+                    FROM keyword_counts c JOIN keywords k ON k.id = c.keyword_id
+                    ORDER BY c.count DESC LIMIT $1
+                ''', args.selected)]
+
+            pg = BenchPostgres(pool)
+            # Used by the keyword index to listen for changes
+            pg.database_url = env.POSTGRES_URL
+            store = KeywordsStore(pg, logging.getLogger("bench"))
+            await store.index.async_start()
+
+            print(f"{args.references} references, {args.keywords} keywords, "
+                  f"~{args.keywords_per_reference} keywords per reference, "
+                  f"selected {selected}\n")
+            report("all counts, GROUP BY", await timed(
+                lambda: counts_group_by(pg, []), args.runs))
+            report("all counts, keyword_counts", await timed(
+                lambda: store.async_get_keywords_counts(), args.runs))
+            report("selected counts, GROUP BY/HAVING", await timed(
+                lambda: counts_group_by(pg, selected), args.runs))
+            report("selected counts, keyword index", await timed(
+                lambda: store.async_get_keywords_counts(selected), args.runs))
+            await store.index.async_stop()
+        finally:
+            await pool.close()
+    finally:
+        await admin.execute(f'DROP SCHEMA {schema} CASCADE')
+        await admin.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--references", type=int, default=100000)
+    parser.add_argument("--keywords", type=int, default=2000)
+    parser.add_argument("--keywords-per-reference", type=int, default=8)
+    parser.add_argument("--selected", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,155 @@
+"""
+Benchmark listing references with keywords.
+
+Compares the old N+1 pattern (one keywords query per reference on a second pool
+connection) with the aggregated single query used by ReferenceStore.
+
+The benchmark seeds a throwaway schema in the database at POSTGRES_URL and drops
+it afterwards. Run from the api directory:
+
+    python -m benchmarks.references_list --references 10000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+
+import asyncpg
+
+import env
+from agents.references import ReferenceStore
+from main import init_connection
+
+SCHEMA_SQL = '''
+    CREATE TABLE "references" (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        type text,
+        source text,
+        title text,
+        summary text,
+        indexed boolean DEFAULT false,
+        created_at timestamp with time zone DEFAULT now(),
+        contents text
+    );
+    CREATE TABLE keywords (id serial PRIMARY KEY, keyword text UNIQUE);
+    CREATE TABLE references_keywords (
+        reference_id uuid REFERENCES "references" (id) ON DELETE CASCADE,
+        keyword_id integer REFERENCES keywords (id) ON DELETE CASCADE,
+        PRIMARY KEY (reference_id, keyword_id)
+    );
+'''
+
+SEED_KEYWORDS_SQL = '''
+    INSERT INTO keywords (keyword)
+    SELECT 'keyword_' || i FROM generate_series(1, $1) i
+'''
+
+SEED_REFERENCES_SQL = '''
+    INSERT INTO "references" (type, source, title, summary, indexed, created_at)
+    SELECT 'url', 'https://example.com/' || i, 'Reference ' || i, 'Summary ' || i, true,
+           now() - make_interval(secs => i)
+    FROM generate_series(1, $1) i
+'''
+
+SEED_REFERENCES_KEYWORDS_SQL = '''
+    INSERT INTO references_keywords (reference_id, keyword_id)
+    SELECT DISTINCT r.id, 1 + (abs(hashtext(r.id::text || j)) % $1)
+    FROM "references" r, generate_series(1, $2) j
+'''
+
+class BenchPostgres:
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+
+async def list_n_plus_one(pg: BenchPostgres) -> list[dict]:
+    """The previous implementation: one keywords query per reference"""
+    async with pg.pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT id, type, source, title, summary, indexed, created_at
+            FROM "references" ORDER BY created_at DESC
+        ''')
+        references = []
+        for row in rows:
+            reference = dict(row)
+            async with pg.pool.acquire() as kw_conn:
+                keywords = await kw_conn.fetch('''
+                    SELECT k.keyword
+                    FROM keywords k
+                    JOIN references_keywords rk ON k.id = rk.keyword_id
+                    WHERE rk.reference_id = $1
+                ''', reference["id"])
+            reference["keywords"] = [k["keyword"] for k in keywords]
+            references.append(reference)
+        return references
+
+async def timed(fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(name: str, timings: list[float]) -> None:
+    print(f"{name:<40} median {statistics.median(timings):9.1f} ms   "
+          f"min {min(timings):9.1f} ms")
+
+async def run(args: argparse.Namespace) -> None:
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = await asyncpg.connect(env.POSTGRES_URL)
+    await admin.execute(f'CREATE SCHEMA {schema}')
+    try:
+        pool = await asyncpg.create_pool(
+            env.POSTGRES_URL,
+            init=init_connection,
+            min_size=2,
+            max_size=10,
+            server_settings={"search_path": schema},
+        )
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(SCHEMA_SQL)
+                await conn.execute(SEED_KEYWORDS_SQL, args.keywords)
+                await conn.execute(SEED_REFERENCES_SQL, args.references)
+                await conn.execute(
+                    SEED_REFERENCES_KEYWORDS_SQL,
+                    args.keywords,
+                    args.keywords_per_reference,
+                )
+                await conn.execute('ANALYZE')
+
+            pg = BenchPostgres(pool)
+            logger = logging.getLogger("bench")
+            store = ReferenceStore(pg, None, None, None, None, None, logger)
+            ids = [str(row["id"]) for row in await pool.fetch(
+                'SELECT id FROM "references" ORDER BY created_at DESC LIMIT $1',
+                args.page,
+            )]
+
+            print(f"{args.references} references, {args.keywords} keywords, "
+                  f"~{args.keywords_per_reference} keywords per reference\n")
+            report("list, N+1 keyword queries", await timed(
+                lambda: list_n_plus_one(pg), args.runs))
+            report("list, aggregated keywords", await timed(
+                lambda: store.async_list(include_keywords=True), args.runs))
+            report(f"get {args.page} by id, aggregated keywords", await timed(
+                lambda: store.async_get_references(ids, include_keywords=True),
+                args.runs))
+        finally:
+            await pool.close()
+    finally:
+        await admin.execute(f'DROP SCHEMA {schema} CASCADE')
+        await admin.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--references", type=int, default=10000)
+    parser.add_argument("--keywords", type=int, default=2000)
+    parser.add_argument("--keywords-per-reference", type=int, default=8)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
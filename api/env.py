@@ -1,4 +1,5 @@
 import os
+
 from dotenv import load_dotenv
 
 load_dotenv('.env.local')
@@ -17,3 +18,87 @@ RELOAD = os.getenv("RELOAD", "true").lower() in ("true", "1", "t")
 
 OPENAI_API_KEY: str = must_env("OPENAI_API_KEY")
 POSTGRES_URL: str = must_env("POSTGRES_URL")
+
+# asyncpg connection pool. Each connection keeps up to POSTGRES_STATEMENT_CACHE_SIZE
+# prepared statements, so repeated queries are parsed and planned once per connection.
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", 2))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10))
+POSTGRES_POOL_MAX_INACTIVE_LIFETIME = float(
+    os.getenv("POSTGRES_POOL_MAX_INACTIVE_LIFETIME", 300)
+)
+POSTGRES_STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", 512))
+# Maximum Postgres connections per process. The llama_index stores get what the
+# asyncpg pool (POSTGRES_POOL_MAX_SIZE) and the keyword index listener leave.
+POSTGRES_CONNECTION_BUDGET = int(os.getenv("POSTGRES_CONNECTION_BUDGET", 20))
+
+# Indexing worker configuration
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", 4))
+INDEX_WORKER_IN_API = (
+    os.getenv("INDEX_WORKER_IN_API", "true").lower() in ("true", "1", "t")
+)
+INDEX_MAX_ATTEMPTS = int(os.getenv("INDEX_MAX_ATTEMPTS", 5))
+INDEX_RETRY_BACKOFF = float(os.getenv("INDEX_RETRY_BACKOFF", 30))
+INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", 2))
+INDEX_JOB_TIMEOUT = float(os.getenv("INDEX_JOB_TIMEOUT", 900))
+INDEX_RECOVER_INTERVAL = float(os.getenv("INDEX_RECOVER_INTERVAL", 60))
+# Indexing profile ("default" or "cheap"), see agents/pipeline.py
+INDEX_PROFILE = os.getenv("INDEX_PROFILE", "default")
+INDEX_BULK_PROFILE = os.getenv("INDEX_BULK_PROFILE", "cheap")
+
+# Bulk URL import: max concurrent fetches in total and per host
+BULK_FETCH_CONCURRENCY = int(os.getenv("BULK_FETCH_CONCURRENCY", 16))
+BULK_FETCH_PER_HOST = int(os.getenv("BULK_FETCH_PER_HOST", 2))
+
+# ANN index on the vector store, see agents/vector_store.py. Build it with
+# `python manage.py vector-index`.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", 16))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", 64))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", 40))
+VECTOR_IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", 100))
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", 1))
+
+# Document fetching and conversion process pool
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", os.cpu_count() or 1))
+CONVERT_TIMEOUT = float(os.getenv("CONVERT_TIMEOUT", 120))
+CONVERT_MAX_BYTES = int(os.getenv("CONVERT_MAX_BYTES", 50 * 1024 * 1024))
+
+# Reference summary strategy ("nodes" or "full_text") for reference types
+# without an explicit strategy, see agents/summaries.py
+SUMMARY_STRATEGY = os.getenv("SUMMARY_STRATEGY", "nodes")
+SUMMARY_FAN_OUT = int(os.getenv("SUMMARY_FAN_OUT", 8))
+
+# Chat retrieval defaults, can be overridden per request. "hybrid" combines
+# vector similarity with full-text search and requires
+# `python manage.py text-search-index`, see agents/retrieval.py
+CHAT_RETRIEVAL_MODE = os.getenv("CHAT_RETRIEVAL_MODE", "dense")
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", 5))
+CHAT_DENSE_WEIGHT = float(os.getenv("CHAT_DENSE_WEIGHT", 1.0))
+CHAT_SPARSE_WEIGHT = float(os.getenv("CHAT_SPARSE_WEIGHT", 1.0))
+# Rank constant of the reciprocal rank fusion
+CHAT_RRF_K = int(os.getenv("CHAT_RRF_K", 60))
+
+# Semantic cache of chat responses, see agents/response_cache.py
+CHAT_CACHE_ENABLED = (
+    os.getenv("CHAT_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+)
+# Minimum cosine similarity of query embeddings for a cache hit
+CHAT_CACHE_THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", 0.95))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 86400))
+
+# Entries of the in-process LRU in front of the embedding cache table
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+
+# Chat history sent to the LLM: recent turns kept verbatim within a token
+# budget, older turns folded into a stored rolling summary, see agents/history.py
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", 6))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 3000))
+CHAT_HISTORY_MAX_PART_CHARS = int(os.getenv("CHAT_HISTORY_MAX_PART_CHARS", 4000))
+# Days before unused conversation summaries are removed by `manage.py gc`
+CHAT_SUMMARY_RETENTION_DAYS = int(os.getenv("CHAT_SUMMARY_RETENTION_DAYS", 30))
+
+# Maximum keywords stored per reference, ranked by TF-IDF
+KEYWORDS_PER_REFERENCE = int(os.getenv("KEYWORDS_PER_REFERENCE", 20))
+
+# Chat latency and token metrics on /metrics and as structured log lines
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("true", "1", "t")
@@ -1,19 +1,19 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-import os
-import uvicorn
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Union
-from contextlib import contextmanager
-from contextlib import asynccontextmanager
+import json
 import logging
-import asyncpg
+from contextlib import asynccontextmanager
+from typing import List
 from uuid import UUID
-import datetime
+
+import asyncpg
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 
 import agents
 import env
+from agents.references import encode_cursor
 
 # Configure proper logging
 logging.basicConfig(
@@ -21,6 +21,9 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
 )
 logger = logging.getLogger("api")
+if env.METRICS_ENABLED:
+    # Structured chat metrics are logged at INFO
+    logging.getLogger("metrics").setLevel(logging.INFO)
 
 async def init_connection(conn):
     """Initialize a database connection with custom type codecs"""
@@ -59,8 +62,12 @@ class Postgres:
             self.pool = await asyncpg.create_pool(
                 self.database_url,
                 init=init_connection,  # Use the init callback for each new connection
-                min_size=2,            # Minimum number of connections
-                max_size=10            # Maximum number of connections
+                min_size=env.POSTGRES_POOL_MIN_SIZE,
+                max_size=env.POSTGRES_POOL_MAX_SIZE,
+                # Close connections idle for longer, down to min_size
+                max_inactive_connection_lifetime=env.POSTGRES_POOL_MAX_INACTIVE_LIFETIME,
+                # Queries are prepared on first use and reused per connection
+                statement_cache_size=env.POSTGRES_STATEMENT_CACHE_SIZE,
             )
             logger.info("Connection pool created successfully with type codecs")
         except Exception as e:
@@ -86,6 +93,7 @@ ai = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    workers = None
     try:
         # Connect to the database when the app starts
         logger.info("Connecting to database...")
@@ -97,6 +105,13 @@ async def lifespan(app: FastAPI):
         global ai
         ai = agents.AI(database, logger)
         logger.info("AI initialized")
+        if ai.metrics is not None:
+            database.pool = ai.metrics.instrument_pool(database.pool)
+        await ai.keywords.index.async_start()
+        
+        if env.INDEX_WORKER_IN_API:
+            workers = ai.index_workers()
+            await workers.start()
         
         yield
     except Exception as e:
@@ -104,6 +119,13 @@ async def lifespan(app: FastAPI):
         logger.exception(e)
         raise
     finally:
+        if workers is not None:
+            await workers.stop()
+        if ai is not None:
+            await ai.keywords.index.async_stop()
+            ai.shutdown()
+            await ai.store_engines.async_dispose()
+        
         # Close database connection when the app shuts down
         logger.info("Disconnecting from database...")
         await database.disconnect()
@@ -125,6 +147,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.middleware("http")
@@ -137,11 +160,16 @@ async def handle_http_exception(request: Request, call_next):
         logger.error(e)
         if isinstance(e, HTTPException):
             raise e
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
     
 
 class ChatRequest(BaseModel):
     messages: List[agents.Message]
+    # Overrides the retrieval defaults (mode, top_k, fusion weights)
+    retrieval: agents.RetrievalOptions | None = None
+    # Restrict retrieval to references with any of these keywords and/or to these IDs
+    keywords: List[str] | None = None
+    reference_ids: List[UUID] | None = None
     
 
 @app.post("/api/chat")
@@ -150,44 +178,137 @@ async def chat(request: ChatRequest):
     if len(messages) == 0:
         raise HTTPException(status_code=400, detail="No messages provided")
 
+    trace = ai.metrics.chat_trace() if ai.metrics is not None else None
+
     query = ''
-    msg, history = messages[-1], [msg.to_chatmessage() for msg in messages[:-1]]
+    msg, earlier = messages[-1], messages[:-1]
     if not isinstance(msg, agents.CoreUserMessage):
-        history.append(msg.to_chatmessage())
+        earlier = messages
     else:
         query = msg.content_str()
 
-    print(messages)
-    messages = [msg.to_chatmessage() for msg in messages]
-    print(messages)
-    
-    chat = ai.get_llm()
-    response = await chat.astream_chat(query, chat_history=history)
-    streaming = StreamingResponse(response.async_response_gen())
+    reference_ids = None
+    if request.reference_ids is not None:
+        reference_ids = [str(id) for id in request.reference_ids]
+    scope = await ai.async_retrieval_scope(request.keywords, reference_ids)
+
+    cached = None
+    if env.CHAT_CACHE_ENABLED and query:
+        context_hash = ai.response_cache.context_hash(
+            earlier,
+            model=ai.models.get_llm().metadata.model_name,
+            retrieval=(request.retrieval or agents.RetrievalOptions()).model_dump(),
+            scope=sorted(scope) if scope is not None else None,
+        )
+        cached = await ai.response_cache.async_lookup(query, context_hash)
+
+    if cached is not None and cached.hit:
+        stream = ai.response_cache.replay(cached)
+        if trace is not None:
+            trace.cache = "hit"
+    else:
+        # Recent turns verbatim, older ones as a summary, within the token budget
+        history = await ai.history.async_history(earlier)
+        chat = ai.get_llm(
+            retrieval=request.retrieval,
+            reference_ids=scope,
+            chat_history=history,
+            trace=trace,
+            query=query,
+            query_embedding=cached.embedding if cached is not None else None,
+        )
+        response = await chat.astream_chat(query)
+        stream = response.async_response_gen()
+        if cached is not None:
+            sources = [node.node.ref_doc_id for node in response.source_nodes]
+            stream = ai.response_cache.record(cached, stream, sources)
+        if trace is not None:
+            trace.cache = "miss" if cached is not None else "disabled"
+            trace.prompt([
+                query,
+                *(m.content or "" for m in history),
+                *(n.node.get_content() for n in response.source_nodes),
+            ])
+
+    if trace is not None:
+        stream = trace.stream(stream)
+    streaming = StreamingResponse(stream)
     streaming.headers['x-vercel-ai-data-stream'] = 'v1'
     return streaming
     
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, only served with METRICS_ENABLED"""
+    if ai.metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        ai.metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
 class ReferenceRequest(BaseModel):
     type: str
     contents: str
 
 class ReferenceResponse(BaseModel):
     id: str
-    type: str
+    # type and indexed may be left out by a `fields` projection
+    type: str | None = None
     title: str | None = None
     summary: str | None = None
     source: str | None = None
-    indexed: bool
+    indexed: bool | None = None
     created_at: str
     contents: str | None = None
     keywords: List[str] | None = None
     
-@app.get("/api/references")
-async def get_references(keywords: str | None = None) -> List[ReferenceResponse]:
-    """Get all references, optionally filtered by keywords"""
+@app.get("/api/references", response_model_exclude_unset=True)
+async def get_references(
+    response: Response,
+    keywords: str | None = None,
+    include_keywords: bool = False,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = None,
+    any_keywords: str | None = None,
+    exclude_keywords: str | None = None,
+) -> List[ReferenceResponse]:
+    """
+    Get references, newest first, optionally filtered by keywords: all of
+    `keywords`, any of `any_keywords` and none of `exclude_keywords`.
+
+    When `limit` is set, the `X-Next-Cursor` response header holds the cursor for
+    the next page, if there is one. `fields` is a comma separated list of fields
+    to return; `id` and `created_at` are always returned.
+    """
     logger.info(f"Getting references with keywords filter: {keywords}")
     keyword_list = keywords.split(',') if keywords else None
-    return await ai.references.async_list(keywords=keyword_list)
+    field_list = fields.split(',') if fields else None
+    try:
+        references = await ai.references.async_list(
+            keywords=keyword_list,
+            include_keywords=include_keywords,
+            limit=limit,
+            cursor=cursor,
+            fields=field_list,
+            any_keywords=any_keywords.split(',') if any_keywords else None,
+            exclude_keywords=exclude_keywords.split(',') if exclude_keywords else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if limit is not None and len(references) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(references[-1])
+    return references
+
+@app.get("/api/references/export")
+async def export_references(contents: bool = False):
+    """Stream all references and their keywords as newline-delimited JSON"""
+    logger.info(f"Exporting references, include_contents: {contents}")
+
+    async def generate():
+        async for reference in ai.references.async_export(include_contents=contents):
+            yield json.dumps(reference) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/api/references/{reference_id}")
 async def get_reference(reference_id: str, contents: bool = False) -> ReferenceResponse:
@@ -224,6 +345,44 @@ async def add_reference(request: ReferenceRequest):
     else:
         raise HTTPException(status_code=400, detail="Invalid reference type, must be 'url'")
 
+class BulkReferenceRequest(BaseModel):
+    urls: List[str]
+    # Indexing profile for the new references, defaults to INDEX_BULK_PROFILE
+    profile: str | None = None
+
+class BulkReferenceResult(BaseModel):
+    url: str
+    status: str  # "added", "exists" or "error"
+    reference_id: str | None = None
+    error: str | None = None
+
+@app.post("/api/references/bulk", response_model=List[BulkReferenceResult])
+async def add_references_bulk(request: BulkReferenceRequest):
+    """Add many URL references at once"""
+    logger.info(f"Adding {len(request.urls)} references in bulk")
+    profile = request.profile or env.INDEX_BULK_PROFILE
+    try:
+        ai.indexing.profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return await ai.references.async_add_urls(
+        request.urls,
+        profile=profile,
+        concurrency=env.BULK_FETCH_CONCURRENCY,
+        per_host=env.BULK_FETCH_PER_HOST,
+    )
+
+class DeleteReferencesRequest(BaseModel):
+    ids: List[UUID]
+
+@app.delete("/api/references")
+async def delete_references(request: DeleteReferencesRequest):
+    """Delete many references by ID in one transaction"""
+    logger.info(f"Deleting {len(request.ids)} references")
+    ids = [str(id) for id in request.ids]
+    deleted = await ai.references.async_delete_references(ids)
+    return {"status": "success", "deleted": deleted}
+
 @app.delete("/api/references/{reference_id}")
 async def delete_reference(reference_id: str):
     """Delete a reference by ID"""
@@ -233,14 +392,17 @@ async def delete_reference(reference_id: str):
     return {"status": "success"}
 
 @app.post("/api/references/{reference_id}/reindex", response_model=ReferenceResponse)
-async def reindex_reference(reference_id: str):
-    """Reindex a reference by ID"""
+async def reindex_reference(reference_id: str, force: bool = False):
+    """
+    Reindex a reference by ID. Unchanged URL references are skipped unless
+    `force` is set.
+    """
     logger.info(f"Reindexing reference with ID: {reference_id}")
     reference = await ai.references.async_get_reference(reference_id)
     if reference is None:
         raise HTTPException(status_code=404, detail="Reference not found")
     
-    reindexed = await ai.references.async_reindex_reference(reference_id)
+    reindexed = await ai.references.async_reindex_reference(reference_id, force=force)
     return reindexed
 
 @app.get("/api/keywords/counts")
@@ -0,0 +1,101 @@
+"""
+Administrative commands for the API database.
+
+Run from the api directory:
+
+    python manage.py gc [--dry-run]
+    python manage.py vector-index [--rebuild]
+    python manage.py text-search-index
+    python manage.py merge-keywords [--apply]
+"""
+import argparse
+import asyncio
+import logging
+
+import env
+from agents.keyword_normalizer import KeywordNormalizer
+from agents.maintenance import StoreMaintenance
+from agents.vector_store import VectorIndexConfig
+from main import Postgres
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger("manage")
+
+async def gc(database: Postgres, args: argparse.Namespace) -> None:
+    counts = await StoreMaintenance(database, logger).async_gc(dry_run=args.dry_run)
+    action = "Found" if args.dry_run else "Removed"
+    for store, count in counts.items():
+        print(f"{action} {count} stale rows in {store}")
+
+async def vector_index(database: Postgres, args: argparse.Namespace) -> None:
+    config = VectorIndexConfig.from_env()
+    maintenance = StoreMaintenance(database, logger)
+    await maintenance.async_build_vector_index(config, rebuild=args.rebuild)
+
+async def text_search_index(database: Postgres, args: argparse.Namespace) -> None:
+    await StoreMaintenance(database, logger).async_build_text_search_index()
+
+async def merge_keywords(database: Postgres, args: argparse.Namespace) -> None:
+    normalizer = KeywordNormalizer(database, logger, env.KEYWORDS_PER_REFERENCE)
+    groups = await normalizer.async_merge_duplicates(dry_run=not args.apply)
+    action = "Merged" if args.apply else "Would merge"
+    for canonical, keywords in groups:
+        print(f"{action} {', '.join(keywords) or canonical} into {canonical}")
+
+async def run(args: argparse.Namespace) -> None:
+    database = Postgres(env.POSTGRES_URL)
+    await database.connect()
+    try:
+        await args.command(database, args)
+    finally:
+        await database.disconnect()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(required=True)
+
+    gc_parser = commands.add_parser(
+        "gc", help="Remove vector, document and cache rows of deleted references"
+    )
+    gc_parser.add_argument(
+        "--dry-run", action="store_true", help="Only count orphaned rows"
+    )
+    gc_parser.set_defaults(command=gc)
+
+    index_parser = commands.add_parser(
+        "vector-index",
+        help="Create the ANN index on the vector store as configured by "
+        "VECTOR_INDEX_TYPE",
+    )
+    index_parser.add_argument(
+        "--rebuild", action="store_true", help="Rebuild the index if it exists"
+    )
+    index_parser.set_defaults(command=vector_index)
+
+    text_parser = commands.add_parser(
+        "text-search-index",
+        help="Create the full-text search column and index on the vector store "
+        "used by hybrid retrieval",
+    )
+    text_parser.set_defaults(command=text_search_index)
+
+    merge_parser = commands.add_parser(
+        "merge-keywords",
+        help="Merge keywords that are variants of the same canonical keyword",
+    )
+    merge_parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Merge the keywords, otherwise they are only listed",
+    )
+    merge_parser.set_defaults(command=merge_keywords)
+
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
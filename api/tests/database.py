@@ -0,0 +1,130 @@
+"""
+Database fixtures for the tests.
+
+Database tests run in a throwaway schema of the database at TEST_POSTGRES_URL
+and are skipped when it is not set. The schema mirrors the migrations the code
+under test depends on; trigger functions are taken from the migration files.
+"""
+import json
+import os
+import unittest
+import uuid
+from pathlib import Path
+
+import asyncpg
+
+from main import init_connection
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+MIGRATIONS = Path(__file__).resolve().parents[2] / "migrations"
+
+SCHEMA_SQL = '''
+    CREATE TABLE "references" (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        type text,
+        source text,
+        title text,
+        summary text,
+        indexed boolean DEFAULT false,
+        created_at timestamp with time zone DEFAULT now(),
+        contents text
+    );
+    CREATE TABLE keywords (id serial PRIMARY KEY, keyword text UNIQUE);
+    CREATE TABLE references_keywords (
+        reference_id uuid REFERENCES "references" (id) ON DELETE CASCADE,
+        keyword_id integer REFERENCES keywords (id) ON DELETE CASCADE,
+        PRIMARY KEY (reference_id, keyword_id)
+    );
+    CREATE TABLE keyword_counts (
+        keyword_id integer PRIMARY KEY REFERENCES keywords (id) ON DELETE CASCADE,
+        count integer DEFAULT 0
+    );
+    CREATE TABLE index_jobs (
+        id bigserial PRIMARY KEY,
+        reference_id uuid REFERENCES "references" (id) ON DELETE CASCADE,
+        status text DEFAULT 'pending',
+        attempts integer DEFAULT 0,
+        last_error text,
+        run_at timestamp with time zone DEFAULT now(),
+        locked_at timestamp with time zone,
+        created_at timestamp with time zone DEFAULT now(),
+        updated_at timestamp with time zone DEFAULT now(),
+        profile text
+    );
+    CREATE INDEX index_jobs_pending_idx ON index_jobs (run_at, id)
+        WHERE status = 'pending';
+    CREATE UNIQUE INDEX index_jobs_pending_reference_idx ON index_jobs (reference_id)
+        WHERE status = 'pending';
+'''
+
+# Migrations whose SQL operations create the triggers on the tables above
+TRIGGER_MIGRATIONS = [
+    "12_create_keyword_counts_table",
+    "13_notify_references_keywords_changes",
+]
+
+def migration_sql(name: str) -> str:
+    """The `up` statements of the SQL operations of a migration"""
+    migration = json.loads((MIGRATIONS / f"{name}.json").read_text())
+    return "; ".join(
+        operation["sql"]["up"]
+        for operation in migration["operations"]
+        if "sql" in operation
+    )
+
+class TestPostgres:
+    def __init__(self, pool: asyncpg.Pool, database_url: str):
+        self.pool = pool
+        # Used by the keyword index to listen for changes
+        self.database_url = database_url
+
+@unittest.skipUnless(TEST_POSTGRES_URL, "TEST_POSTGRES_URL is not set")
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Runs each test in a new schema, dropped afterwards"""
+
+    async def asyncSetUp(self) -> None:
+        self.schema = f"test_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_POSTGRES_URL)
+        await self.admin.execute(f'CREATE SCHEMA {self.schema}')
+        self.pool = await asyncpg.create_pool(
+            TEST_POSTGRES_URL,
+            init=init_connection,
+            min_size=1,
+            max_size=4,
+            # Extensions such as pgvector are found in public
+            server_settings={"search_path": f"{self.schema}, public"},
+        )
+        self.pg = TestPostgres(self.pool, TEST_POSTGRES_URL)
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA_SQL)
+            for name in TRIGGER_MIGRATIONS:
+                await conn.execute(migration_sql(name))
+
+    async def asyncTearDown(self) -> None:
+        await self.pool.close()
+        await self.admin.execute(f'DROP SCHEMA {self.schema} CASCADE')
+        await self.admin.close()
+
+    async def async_add_reference(
+        self, keywords: list[str] | None = None, indexed: bool = True
+    ) -> str:
+        """Insert a reference with the given keywords, returning its ID"""
+        async with self.pool.acquire() as conn:
+            reference_id = await conn.fetchval(
+                'INSERT INTO "references" (type, indexed) VALUES ($1, $2) RETURNING id',
+                "text",
+                indexed,
+            )
+            if keywords:
+                await conn.execute('''
+                    WITH keyword_ids AS (
+                        INSERT INTO keywords (keyword)
+                        SELECT unnest($2::text[])
+                        ON CONFLICT (keyword) DO UPDATE SET keyword = EXCLUDED.keyword
+                        RETURNING id
+                    )
+                    INSERT INTO references_keywords (reference_id, keyword_id)
+                    SELECT $1::uuid, id FROM keyword_ids
+                ''', reference_id, keywords)
+        return reference_id
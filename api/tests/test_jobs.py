@@ -0,0 +1,85 @@
+import logging
+
+from agents.jobs import JobQueue
+from tests.database import DatabaseTestCase
+
+
+class JobQueueTest(DatabaseTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.queue = JobQueue(
+            self.pg,
+            logging.getLogger("test"),
+            max_attempts=2,
+            retry_backoff=0,
+            job_timeout=60,
+        )
+
+    async def async_jobs(self) -> list[dict]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT reference_id, status, attempts, last_error
+                FROM index_jobs ORDER BY id
+            ''')
+        return [dict(row) for row in rows]
+
+    async def test_failed_jobs_are_retried_until_max_attempts(self):
+        reference_id = await self.async_add_reference(indexed=False)
+        await self.queue.async_enqueue(reference_id)
+
+        job = await self.queue.async_claim()
+        self.assertEqual(job["reference_id"], reference_id)
+        self.assertEqual(job["attempts"], 1)
+        await self.queue.async_fail(job["id"], "first")
+        [row] = await self.async_jobs()
+        self.assertEqual((row["status"], row["last_error"]), ("pending", "first"))
+
+        job = await self.queue.async_claim()
+        self.assertEqual(job["attempts"], 2)
+        await self.queue.async_fail(job["id"], "second")
+        [row] = await self.async_jobs()
+        self.assertEqual((row["status"], row["last_error"]), ("failed", "second"))
+        self.assertIsNone(await self.queue.async_claim())
+
+    async def test_failed_job_is_dropped_for_a_newer_pending_one(self):
+        reference_id = await self.async_add_reference(indexed=False)
+        await self.queue.async_enqueue(reference_id)
+        job = await self.queue.async_claim()
+        await self.queue.async_enqueue(reference_id)
+        await self.queue.async_fail(job["id"], "error")
+        statuses = [row["status"] for row in await self.async_jobs()]
+        self.assertEqual(statuses, ["failed", "pending"])
+
+    async def test_recover_expired_leases(self):
+        retried = await self.async_add_reference(indexed=False)
+        exhausted = await self.async_add_reference(indexed=False)
+        await self.queue.async_enqueue_many([retried, exhausted])
+        for _ in range(2):
+            await self.queue.async_claim()
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE index_jobs
+                SET locked_at = now() - interval '1 hour',
+                    attempts = CASE WHEN reference_id = $1 THEN 2 ELSE attempts END
+            ''', exhausted)
+
+        self.assertEqual(await self.queue.async_recover(), 2)
+        jobs = {row["reference_id"]: row for row in await self.async_jobs()}
+        self.assertEqual(jobs[retried]["status"], "pending")
+        self.assertEqual(jobs[exhausted]["status"], "failed")
+        self.assertEqual(jobs[exhausted]["last_error"], "Lease expired")
+
+    async def test_recover_leaves_running_jobs(self):
+        reference_id = await self.async_add_reference(indexed=False)
+        await self.queue.async_enqueue(reference_id)
+        await self.queue.async_claim()
+        self.assertEqual(await self.queue.async_recover(), 0)
+        [row] = await self.async_jobs()
+        self.assertEqual(row["status"], "running")
+
+    async def test_recover_unindexed_references_without_job(self):
+        orphaned = await self.async_add_reference(indexed=False)
+        await self.async_add_reference(indexed=True)
+        self.assertEqual(await self.queue.async_recover(), 1)
+        [row] = await self.async_jobs()
+        self.assertEqual((row["reference_id"], row["status"]), (orphaned, "pending"))
@@ -0,0 +1,59 @@
+import logging
+
+from agents.keywords import KeywordsStore
+from tests.database import DatabaseTestCase
+
+
+class KeywordCountsTest(DatabaseTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.store = KeywordsStore(self.pg, logging.getLogger("test"))
+
+    async def asyncTearDown(self) -> None:
+        await self.store.index.async_stop()
+        await super().asyncTearDown()
+
+    async def test_counts_follow_inserts_and_deletes(self):
+        first = await self.async_add_reference(["postgres", "python"])
+        await self.async_add_reference(["postgres", "rust"])
+        await self.async_add_reference(["postgres"])
+        self.assertEqual(
+            await self.store.async_get_keywords_counts(),
+            {"postgres": 3, "python": 1, "rust": 1},
+        )
+
+        async with self.pool.acquire() as conn:
+            await conn.execute('DELETE FROM "references" WHERE id = $1', first)
+        self.assertEqual(
+            await self.store.async_get_keywords_counts(),
+            {"postgres": 2, "rust": 1},
+        )
+        async with self.pool.acquire() as conn:
+            count = await conn.fetchval('''
+                SELECT count(*) FROM keyword_counts c
+                JOIN keywords k ON k.id = c.keyword_id
+                WHERE k.keyword = 'python'
+            ''')
+        # Counts that drop to zero are removed
+        self.assertEqual(count, 0)
+
+    async def test_deleting_a_keyword(self):
+        await self.async_add_reference(["postgres", "python"])
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM keywords WHERE keyword = 'python'")
+        self.assertEqual(
+            await self.store.async_get_keywords_counts(), {"postgres": 1}
+        )
+
+    async def test_selected_counts_match_the_table(self):
+        await self.async_add_reference(["postgres", "python"])
+        await self.async_add_reference(["postgres", "rust"])
+        await self.async_add_reference(["python"])
+        self.assertEqual(
+            await self.store.async_get_keywords_counts(["postgres"]),
+            {"postgres": 2, "python": 1, "rust": 1},
+        )
+        self.assertEqual(
+            await self.store.async_get_keywords_counts(["postgres", "rust"]),
+            {"postgres": 1, "rust": 1},
+        )
@@ -0,0 +1,32 @@
+import base64
+import unittest
+
+from agents.references import decode_cursor, encode_cursor
+
+
+def _encode(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+class CursorTest(unittest.TestCase):
+    def test_round_trip(self):
+        reference = {
+            "id": "0b5f0a52-4b8e-4c53-a0b8-62b0b3f8a1f4",
+            "created_at": "2025-03-01 12:30:45.123456+00",
+        }
+        cursor = encode_cursor(reference)
+        self.assertEqual(
+            decode_cursor(cursor), (reference["created_at"], reference["id"])
+        )
+
+    def test_invalid_cursors(self):
+        reference_id = "0b5f0a52-4b8e-4c53-a0b8-62b0b3f8a1f4"
+        for cursor in [
+            "not base64!",
+            _encode("no separator"),
+            _encode(f"yesterday|{reference_id}"),
+            _encode("2025-03-01 12:30:45+00|not-a-uuid"),
+            _encode(f"2025-03-01 12:30:45+00|{reference_id}|extra"),
+        ]:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decode_cursor(cursor)
@@ -0,0 +1,40 @@
+import unittest
+
+from agents.prompt import CoreAssistantMessage, CoreUserMessage
+from agents.response_cache import ResponseCache
+
+
+class ContextHashTest(unittest.TestCase):
+    def setUp(self):
+        self.history = [
+            CoreUserMessage(role="user", content="What is pgvector?"),
+            CoreAssistantMessage(role="assistant", content="A Postgres extension."),
+        ]
+
+    def test_same_context(self):
+        self.assertEqual(
+            ResponseCache.context_hash(self.history, "gpt-4o-mini", scope=None),
+            ResponseCache.context_hash(list(self.history), "gpt-4o-mini", scope=None),
+        )
+
+    def test_model_is_part_of_the_key(self):
+        self.assertNotEqual(
+            ResponseCache.context_hash(self.history, "gpt-4o-mini"),
+            ResponseCache.context_hash(self.history, "gpt-4o"),
+        )
+
+    def test_history_is_part_of_the_key(self):
+        self.assertNotEqual(
+            ResponseCache.context_hash(self.history, "gpt-4o-mini"),
+            ResponseCache.context_hash(self.history[:1], "gpt-4o-mini"),
+        )
+
+    def test_params_are_part_of_the_key(self):
+        self.assertNotEqual(
+            ResponseCache.context_hash(self.history, "gpt-4o-mini", scope=None),
+            ResponseCache.context_hash(self.history, "gpt-4o-mini", scope=["a"]),
+        )
+        self.assertEqual(
+            ResponseCache.context_hash(self.history, "m", top_k=5, mode="dense"),
+            ResponseCache.context_hash(self.history, "m", mode="dense", top_k=5),
+        )
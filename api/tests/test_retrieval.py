@@ -0,0 +1,73 @@
+import json
+from unittest import mock
+
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from agents.maintenance import TEXT_SEARCH_CONFIG, VECTORS_TABLE
+from agents.retrieval import HybridRetriever
+from tests.database import DatabaseTestCase
+
+# Chunks of the query "apple" with their embedding, the query embedding is [1, 0].
+# Dense ranking: dense, both, sparse. Full-text ranking: both, sparse.
+CHUNKS = {
+    "dense": ([1.0, 0.0], "car engine"),
+    "both": ([0.9, 0.1], "apple apple pie"),
+    "sparse": ([0.0, 1.0], "apple tart"),
+}
+
+class HybridRetrieverTest(DatabaseTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with self.pool.acquire() as conn:
+            await conn.execute('CREATE EXTENSION IF NOT EXISTS vector')
+            await conn.execute(f'''
+                CREATE TABLE "data_{VECTORS_TABLE}" (
+                    id bigserial PRIMARY KEY,
+                    node_id varchar,
+                    text varchar,
+                    metadata_ jsonb,
+                    embedding vector(2),
+                    text_search_tsv tsvector GENERATED ALWAYS AS (
+                        to_tsvector('{TEXT_SEARCH_CONFIG}', text)
+                    ) STORED
+                )
+            ''')
+            for node_id, (embedding, text) in CHUNKS.items():
+                node = TextNode(id_=node_id, text=text)
+                await conn.execute(f'''
+                    INSERT INTO "data_{VECTORS_TABLE}"
+                        (node_id, text, metadata_, embedding)
+                    VALUES ($1, $2, $3::jsonb, $4::text::vector)
+                ''', node_id, text, json.dumps(node_to_metadata_dict(node)),
+                    json.dumps(embedding))
+        # The retriever reads the vectors table of the store schema
+        patcher = mock.patch("agents.retrieval.STORE_SCHEMA", self.schema)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def async_retrieve(self, **kwargs) -> list[str]:
+        retriever = HybridRetriever(self.pg, embed_model=None, top_k=3, **kwargs)
+        query = QueryBundle("apple", embedding=[1.0, 0.0])
+        return [result.node.node_id for result in await retriever.aretrieve(query)]
+
+    async def test_fusion_ranks_chunks_of_both_rankings_first(self):
+        self.assertEqual(await self.async_retrieve(), ["both", "sparse", "dense"])
+
+    async def test_dense_ranking_without_sparse_weight(self):
+        self.assertEqual(
+            await self.async_retrieve(sparse_weight=0), ["dense", "both", "sparse"]
+        )
+
+    async def test_scores_are_weighted_reciprocal_ranks(self):
+        retriever = HybridRetriever(
+            self.pg, embed_model=None, dense_weight=2, rrf_k=10
+        )
+        query = QueryBundle("apple", embedding=[1.0, 0.0])
+        scores = {
+            result.node.node_id: result.score
+            for result in await retriever.aretrieve(query)
+        }
+        self.assertAlmostEqual(scores["dense"], 2 / 11)
+        self.assertAlmostEqual(scores["both"], 2 / 12 + 1 / 11)
+        self.assertAlmostEqual(scores["sparse"], 2 / 13 + 1 / 12)
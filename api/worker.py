@@ -0,0 +1,47 @@
+"""
+Standalone indexing worker.
+
+Runs the indexing worker pool without the HTTP API, so indexing throughput can
+be scaled independently of API latency. Start one or more of these next to the
+API and set INDEX_WORKER_IN_API=false for the API process.
+"""
+import asyncio
+import logging
+import signal
+
+import agents
+import env
+from main import Postgres
+
+logging.basicConfig(
+    level=logging.INFO if env.DEBUG else logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger("worker")
+
+async def run():
+    database = Postgres(env.POSTGRES_URL)
+    await database.connect()
+    ai = None
+    workers = None
+    try:
+        ai = agents.AI(database, logger)
+        workers = ai.index_workers()
+        await workers.start()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        if workers is not None:
+            await workers.stop()
+        if ai is not None:
+            ai.shutdown()
+            await ai.store_engines.async_dispose()
+        await database.disconnect()
+
+if __name__ == "__main__":
+    print(f"Starting indexing worker with {env.INDEX_WORKERS} workers")
+    asyncio.run(run())
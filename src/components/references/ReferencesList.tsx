@@ -14,10 +14,11 @@ export default function ReferencesList({ selectedTags }: ReferencesListProps) {
 
   const fetchReferences = useCallback(async () => {
     try {
-      // Include selected tags in the API request if any are selected
+      // Include selected tags in the API request if any are selected.
+      // Keywords are returned with the references so cards don't fetch them one by one.
       const queryParams = selectedTags.length > 0 
-        ? `?keywords=${selectedTags.join(',')}` 
-        : '';
+        ? `?include_keywords=true&keywords=${selectedTags.join(',')}` 
+        : '?include_keywords=true';
       
       const response = await fetch(`/api/references${queryParams}`);
       if (!response.ok) {